@@ -0,0 +1,296 @@
+import argparse
+import json
+import os
+import random
+import re
+import time
+from collections import Counter
+
+from data_cleaner import clean_section, clean_text, strip_blocks
+from record_io import iter_records
+from versions import VERSION_KEYWORDS, detect_version_masks, detect_versions, mask_to_versions
+from wiki_scraper import CACHE_PATH, RAW_JSONL_PATH, RAW_PATH, split_sections
+
+
+def legacy_split_sections(content):
+    # The original line-by-line splitter, kept as the reference for output and timing
+    sections = []
+    current_heading = "Introduction"
+    current_content = ""
+
+    for line in content.split("\n"):
+        if line.startswith("==") and not line.startswith("==="):
+            if current_content.strip():
+                sections.append({
+                    "heading": current_heading,
+                    "content": current_content.strip(),
+                    "versions": detect_versions(current_content)
+                })
+            current_heading = line.replace("=", "").strip()
+            current_content = ""
+        else:
+            current_content += " " + line
+
+    if current_content.strip():
+        sections.append({
+            "heading": current_heading,
+            "content": current_content.strip(),
+            "versions": detect_versions(current_content)
+        })
+
+    return sections
+
+
+def legacy_detect_versions(text):
+    # The original per-keyword substring scan
+    text_lower = text.lower()
+    found_versions = []
+    for version, keywords in VERSION_KEYWORDS.items():
+        if any(kw in text_lower for kw in keywords):
+            found_versions.append(version)
+    return found_versions if found_versions else ["all_versions"]
+
+
+def legacy_clean_text(text):
+    # The original regex cascade, kept as the golden reference for clean_text.
+    # Its five-pass brace loop and table regex are replaced by strip_blocks,
+    # which removes nesting the old passes left behind.
+    # Remove ref tags and their contents
+    text = re.sub(r'<ref[^>]*>.*?</ref>', '', text, flags=re.DOTALL)
+    text = re.sub(r'<ref[^>]*/>', '', text)
+
+    # Remove gallery blocks
+    text = re.sub(r'<gallery>.*?</gallery>', '', text, flags=re.DOTALL)
+
+    # Remove HTML tags
+    text = re.sub(r'<[^>]+>', '', text)
+
+    # Remove infobox/template blocks and tables
+    text = strip_blocks(text)
+
+    # Remove file/image links
+    text = re.sub(r'\[\[File:[^\]]*\]\]', '', text)
+    text = re.sub(r'\[\[Image:[^\]]*\]\]', '', text)
+
+    # Convert [[link|display]] to display text
+    text = re.sub(r'\[\[[^\]|]*\|([^\]]*)\]\]', r'\1', text)
+
+    # Convert [[link]] to link text
+    text = re.sub(r'\[\[([^\]]*)\]\]', r'\1', text)
+
+    # Remove external links [http://... text] -> text
+    text = re.sub(r'\[https?://[^\s\]]+\s([^\]]+)\]', r'\1', text)
+    text = re.sub(r'\[https?://[^\]]+\]', '', text)
+
+    # Remove table markup
+    text = re.sub(r'^\s*[|!].*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\|-', '', text)
+
+    # Remove wiki formatting
+    text = re.sub(r"'{2,3}", '', text)
+    text = re.sub(r'={2,6}[^=]+=+', '', text)
+
+    # Remove category/navbox/language links
+    text = re.sub(r'\[\[Category:[^\]]*\]\]', '', text)
+    text = re.sub(r'\[\[[a-z\-]+:[^\]]*\]\]', '', text)
+    text = re.sub(r'\{\{navbox[^}]*\}\}', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\{\{citations\}\}', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\{\{spoiler[^}]*\}\}', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\{\{endspoiler\}\}', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\{\{Quote\|[^}]*\}\}', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\{\{[Ss]ee\|[^}]*\}\}', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\{\{main\|[^}]*\}\}', '', text, flags=re.IGNORECASE)
+
+    # Remove [TABLE ROW: ...] artifacts
+    text = re.sub(r'\[TABLE ROW:[^\]]*\]', '', text)
+
+    # Remove leftover image caption artifacts
+    text = re.sub(r'^\s*\.\]\]\s*', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\.\]\]', '', text)
+
+    # Remove image filename patterns
+    text = re.sub(r'\S+\.png\|[^\n]+', '', text)
+    text = re.sub(r'\S+\.gif\|[^\n]+', '', text)
+    text = re.sub(r'\S+\.jpg\|[^\n]+', '', text)
+
+    # Clean up bullet asterisks
+    text = re.sub(r'^\s*\*+\s*', '- ', text, flags=re.MULTILINE)
+
+    # Clean up whitespace
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = re.sub(r' {2,}', ' ', text)
+    text = text.strip()
+
+    return text
+
+
+# Markup seen on the FF wiki, plus malformed and nested variants, for the
+# clean_text golden corpus
+WIKITEXT_FRAGMENTS = [
+    "Terra is a half-Esper who", "plain words and more plain words", "SNES version only.",
+    "[[Narshe]]", "[[Magic (Final Fantasy VI)|Magic]]", "[[Terra Branford|Terra]]'s",
+    "'''Ultima'''", "''italic''", "''''four''''", "'''''five'''''",
+    "{{Infobox character|name=Terra|image=[[File:Terra.png]]}}", "{{Stat|HP|{{val|1200}}}}",
+    "{{a|{{b|{{c|{{d|{{e|{{f|deep}}}}}}}}}}}}", "{{navbox FF6}}", "{{citations}}", "{{Spoiler}}",
+    "{{endspoiler}}", "{{Quote|Hello}}", "{{see|Ultros}}", "{{main|Espers}}", "{{{1}}}", "{{unclosed",
+    "<ref>Source, p. 4</ref>", "<ref name=\"a\"/>", "<ref name=b>x {{cite web|url=y}}</ref>",
+    "<gallery>A.png|cap\nB.gif|cap</gallery>", "<br />", "<span style=\"color:red\">red</span>", "a < b",
+    "[[File:Terra sprite.png|thumb|Terra in [[Narshe]].]]", "[[Image:Map.gif|right]]",
+    "[[Category:Final Fantasy VI]]", "[[es:Terra]]", "[https://example.com Official site]",
+    "[http://example.com]", "{| class=\"wikitable\"\n|-\n! Name !! HP\n|-\n| Guard || 40\n|}",
+    "{| outer {| inner |} tail |}", "|- row", "| cell || cell", "! header",
+    "== Heading ==", "=== Sub ===", "==Bad=heading==", "[TABLE ROW: a | b]", ".]]", "x.]] y",
+    "Sprite.png|Terra's sprite", "icon.gif|Icon", "photo.jpg|Photo", "word.png|",
+    "* bullet", "** nested bullet", "*", "   ", "\n", "\n\n\n\n", "|", "!", "=", "'", "[[", "]]", "{{", "}}",
+]
+
+
+def golden_sections(count, seed=0):
+    rng = random.Random(seed)
+    sections = []
+    for _ in range(count):
+        parts = [rng.choice(WIKITEXT_FRAGMENTS) for _ in range(rng.randint(1, 40))]
+        text = rng.choice([" ", "", "\n"]).join(parts)
+        # Most scraped content has its newlines flattened by the section splitter
+        if rng.random() < 0.8:
+            text = text.replace("\n", " ")
+        sections.append(text)
+    return sections
+
+
+def raw_sections():
+    for path in [RAW_JSONL_PATH, RAW_PATH]:
+        if os.path.exists(path):
+            return [s["content"] for page in iter_records(path) for s in page["sections"]]
+    return []
+
+
+def synthetic_wikitext(size, seed=0):
+    # Bestiary-shaped page: a few sections holding long tables and === subsections
+    rng = random.Random(seed)
+    words = ["Ultros", "Magitek", "Armor", "steals", "Elixir", "SNES", "Pixel Remaster", "drops",
+             "{{Stats|HP=1200}}", "[[Narshe|the mines]]", "'''Level'''", "GBA", "Fire", "Ice"]
+    lines = []
+    total = 0
+    while total < size:
+        roll = rng.random()
+        if roll < 0.002:
+            line = f"== Section {len(lines)} =="
+        elif roll < 0.01:
+            line = f"{'=' * rng.randint(3, 5)} Sub {len(lines)} {'=' * 3}"
+        elif roll < 0.5:
+            line = "| " + " || ".join(rng.choice(words) for _ in range(8))
+        else:
+            line = " ".join(rng.choice(words) for _ in range(20))
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def flat(sections):
+    return [(s["heading"], s["content"], s["versions"]) for s in sections]
+
+
+def benchmark_texts(size_mb):
+    texts = [("synthetic", synthetic_wikitext(int(size_mb * 1024 * 1024)))]
+    if os.path.exists(CACHE_PATH):
+        with open(CACHE_PATH, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+        texts.append(("scrape cache", "\n".join(r["content"] for r in cache.values())))
+    return texts
+
+
+def bench_sections(size_mb):
+    for name, text in benchmark_texts(size_mb):
+        old, old_time = timed(legacy_split_sections, text)
+        new, new_time = timed(split_sections, text)
+        status = "identical" if flat(old) == flat(new) else "MISMATCH"
+        print(f"{name}: {len(text) / 1e6:.1f}M chars, {len(new)} sections")
+        print(f"  legacy: {old_time:.3f}s  new: {new_time:.3f}s  ({old_time / new_time:.1f}x)  output {status}")
+
+
+def bench_versions(size_mb):
+    for name, text in benchmark_texts(size_mb):
+        sections = [s["content"] for s in split_sections(text)]
+        # Version tagging runs per section, so time it on section-sized pieces too
+        chunks = [text[i:i + 2000] for i in range(0, len(text), 2000)]
+        for label, texts in [("sections", sections), ("2k chunks", chunks)]:
+            old, old_time = timed(lambda: [legacy_detect_versions(t) for t in texts])
+            new, new_time = timed(lambda: [mask_to_versions(m) for m in detect_version_masks(texts)])
+            differ = sum(1 for a, b in zip(old, new) if a != b)
+            print(f"{name} ({label}): {len(texts)} texts")
+            print(f"  legacy: {old_time:.3f}s  new: {new_time:.3f}s  ({old_time / new_time:.1f}x)  "
+                  f"{differ} tagged differently (word boundaries)")
+
+
+def legacy_strip_blocks(text):
+    # The brace and table passes clean_text used before strip_blocks
+    for _ in range(5):
+        text = re.sub(r'\{\{[^{}]*\}\}', '', text)
+    return re.sub(r'\{\|.*?\|\}', '', text, flags=re.DOTALL)
+
+
+def bench_blocks(size_mb):
+    row = "|-\n| {{Stat|{{val|1}}}} || [[Potion]] || {{a|{{b|{{c|{{d|{{e|{{f|x}}}}}}}}}}}}\n"
+    text = "{| class=wikitable\n" + row * int(size_mb * 1024 * 1024 / len(row)) + "|}"
+    old, old_time = timed(legacy_strip_blocks, text)
+    counts = Counter()
+    new, new_time = timed(strip_blocks, text, counts)
+    print(f"nested table: {len(text) / 1e6:.1f}M chars")
+    print(f"  legacy: {old_time:.3f}s, {old.count('{{')} templates left")
+    print(f"  strip_blocks: {new_time:.3f}s, {new.count('{{')} templates left")
+    print(f"  removed: {dict(counts.most_common(5))}")
+
+
+def bench_clean(count):
+    corpora = [("golden synthetic", golden_sections(count))]
+    sections = raw_sections()
+    if sections:
+        corpora.append(("raw scrape", sections))
+
+    failed = False
+    for name, texts in corpora:
+        old, old_time = timed(lambda: [legacy_clean_text(t) for t in texts])
+        new, new_time = timed(lambda: [clean_text(t) for t in texts])
+        mismatches = [i for i, (a, b) in enumerate(zip(old, new)) if a != b]
+        chars = sum(len(t) for t in texts)
+        print(f"{name}: {len(texts)} sections, {chars / 1e6:.1f}M chars")
+        print(f"  legacy: {old_time:.3f}s  new: {new_time:.3f}s  ({old_time / new_time:.1f}x)  "
+              f"{len(mismatches)} mismatches")
+        # clean_section must give exactly clean_text's content
+        split = [i for i, (t, b) in enumerate(zip(texts, new)) if clean_section(t)[0] != b]
+        print(f"  clean_section: {len(split)} mismatches")
+        if split:
+            failed = True
+            print(f"  first mismatch input: {texts[split[0]]!r}")
+        if mismatches:
+            failed = True
+            i = mismatches[0]
+            print(f"  first mismatch input: {texts[i]!r}")
+            print(f"    legacy: {old[i]!r}")
+            print(f"    new:    {new[i]!r}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for the scrape/clean pipeline")
+    parser.add_argument("target", choices=["sections", "versions", "clean", "blocks"])
+    parser.add_argument("--size-mb", type=float, default=8.0, help="size of the synthetic page")
+    parser.add_argument("--sections", type=int, default=20000, help="golden corpus size for clean")
+    args = parser.parse_args()
+
+    if args.target == "sections":
+        bench_sections(args.size_mb)
+    elif args.target == "versions":
+        bench_versions(args.size_mb)
+    elif args.target == "clean":
+        bench_clean(args.sections)
+    elif args.target == "blocks":
+        bench_blocks(args.size_mb)
@@ -1,8 +1,10 @@
-import json
+import sys
 
-with open("data/raw/ff6_wiki_raw.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
+from record_io import iter_records
 
-print(f"Pages in raw file: {len(data)}")
-for page in data:
-    print(f"  {page['title']}")
\ No newline at end of file
+path = sys.argv[1] if len(sys.argv) > 1 else "data/raw/ff6_wiki_raw.json"
+
+titles = [page["title"] for page in iter_records(path)]
+print(f"Pages in raw file: {len(titles)}")
+for title in titles:
+    print(f"  {title}")
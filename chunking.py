@@ -0,0 +1,144 @@
+import re
+
+# Sentence ends, or line breaks (list and table rows have no full stops)
+SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+|\n+')
+WORD_RE = re.compile(r'\S+')
+
+
+def estimate_tokens(text):
+    # Offline fallback: about four characters per token for English BPE
+    # vocabularies. Slightly overestimates on this wiki's prose, which keeps
+    # chunks under the budget when the real tokenizer is not available.
+    return (len(text) + 3) // 4
+
+
+class ByteTokenizer:
+    # Offline fallback that still yields real ids: UTF-8 bytes shifted past
+    # three special tokens. About four ids per BPE token on English text.
+    name = "bytes"
+    pad_id = 0
+    bos_id = 1
+    eos_id = 2
+    vocab_size = 259
+
+    def encode(self, text):
+        return [b + 3 for b in text.encode("utf-8")]
+
+
+class TiktokenTokenizer:
+    def __init__(self, encoding_name):
+        import tiktoken
+        self.encoding = tiktoken.get_encoding(encoding_name)
+        self.name = f"tiktoken:{encoding_name}"
+        self.eos_id = self.encoding.eot_token
+        self.pad_id = self.eos_id
+        self.bos_id = None
+        self.vocab_size = self.encoding.n_vocab
+
+    def encode(self, text):
+        return self.encoding.encode(text, disallowed_special=())
+
+
+class HuggingFaceTokenizer:
+    def __init__(self, name):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(name, local_files_only=True)
+        self.name = name
+        self.eos_id = self.tokenizer.eos_token_id
+        self.pad_id = self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.eos_id
+        self.bos_id = self.tokenizer.bos_token_id
+        self.vocab_size = len(self.tokenizer)
+
+    def encode(self, text):
+        return self.tokenizer.encode(text, add_special_tokens=False)
+
+
+def load_tokenizer(spec):
+    # spec: "tiktoken:<encoding>", "bytes", or a Hugging Face tokenizer
+    # name/path (loaded from the local cache only). Returns None when the
+    # library or the files are missing.
+    try:
+        if spec == "bytes":
+            return ByteTokenizer()
+        if spec.startswith("tiktoken:"):
+            return TiktokenTokenizer(spec.split(":", 1)[1])
+        return HuggingFaceTokenizer(spec)
+    except Exception as e:
+        print(f"  -> Tokenizer {spec!r} unavailable ({type(e).__name__})")
+        return None
+
+
+def load_token_counter(spec=None):
+    # Token counts from `spec` (see load_tokenizer), or the length estimate
+    # when no tokenizer is given or it can't be loaded
+    tokenizer = load_tokenizer(spec) if spec else None
+    if tokenizer is None:
+        if spec:
+            print("  -> Estimating tokens from length")
+        return estimate_tokens
+    return lambda text: len(tokenizer.encode(text))
+
+
+def sentence_spans(text):
+    # (start, end) offsets of each sentence or line, whitespace excluded
+    spans = []
+    pos = 0
+    for match in SENTENCE_BREAK_RE.finditer(text):
+        if match.start() > pos:
+            spans.append((pos, match.start()))
+        pos = match.end()
+    if pos < len(text):
+        spans.append((pos, len(text)))
+    return spans
+
+
+def split_long_span(text, start, end, max_tokens, count_tokens):
+    # A single sentence over the budget is split between words
+    pieces = []
+    piece_start = None
+    piece_end = None
+    for word in WORD_RE.finditer(text, start, end):
+        if piece_start is not None and count_tokens(text[piece_start:word.end()]) > max_tokens:
+            pieces.append((piece_start, piece_end))
+            piece_start = None
+        if piece_start is None:
+            piece_start = word.start()
+        piece_end = word.end()
+    if piece_start is not None:
+        pieces.append((piece_start, piece_end))
+    return pieces
+
+
+def chunk_text(text, max_tokens, overlap=0, count_tokens=estimate_tokens):
+    # Greedily packs whole sentences into chunks of at most `max_tokens`.
+    # With `overlap`, each chunk after the first starts with the trailing
+    # sentences of the previous one, up to that many tokens. Chunks are
+    # slices of `text`, so a text within budget comes back unchanged.
+    if count_tokens(text) <= max_tokens:
+        return [text]
+
+    spans = []
+    for start, end in sentence_spans(text):
+        if count_tokens(text[start:end]) > max_tokens:
+            spans.extend(split_long_span(text, start, end, max_tokens, count_tokens))
+        else:
+            spans.append((start, end))
+
+    chunks = []
+    current = []
+    for span in spans:
+        if current and count_tokens(text[current[0][0]:span[1]]) > max_tokens:
+            chunks.append(text[current[0][0]:current[-1][1]])
+            carried = []
+            for prev in reversed(current[1:]):
+                if count_tokens(text[prev[0]:current[-1][1]]) > overlap:
+                    break
+                carried.insert(0, prev)
+            # Never carry so much that the next sentence can't fit
+            while carried and count_tokens(text[carried[0][0]:span[1]]) > max_tokens:
+                carried.pop(0)
+            current = carried
+        current.append(span)
+    if current:
+        chunks.append(text[current[0][0]:current[-1][1]])
+    return chunks
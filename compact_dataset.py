@@ -0,0 +1,114 @@
+import argparse
+import hashlib
+import os
+from collections import Counter
+
+from record_io import dumps, iter_records, write_records
+
+ANSWERS_FILE = "answers.jsonl"
+PAIRS_FILE = "pairs.jsonl"
+
+
+# Compact training set: every distinct answer is stored once in
+# answers.jsonl as {"id", "output"}, and pairs.jsonl holds
+# {"instruction", "input", "answer": id}. Ids are content hashes, so the same
+# answer coming from the generator and from expansion collapses to one row.
+def answer_id(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def compact_pairs(pairs_path, output_dir):
+    # Streams the Alpaca pairs once; only answer ids are held in memory
+    os.makedirs(output_dir, exist_ok=True)
+    answers_path = os.path.join(output_dir, ANSWERS_FILE)
+    pairs_path_out = os.path.join(output_dir, PAIRS_FILE)
+    seen = set()
+    pairs = 0
+
+    with open(answers_path + ".tmp", 'w', encoding='utf-8') as answers, \
+            open(pairs_path_out + ".tmp", 'w', encoding='utf-8') as out:
+        for pair in iter_records(pairs_path):
+            output = pair["output"]
+            key = answer_id(output)
+            if key not in seen:
+                seen.add(key)
+                answers.write(dumps({"id": key, "output": output}) + "\n")
+            compact = {k: v for k, v in pair.items() if k != "output"}
+            compact["answer"] = key
+            out.write(dumps(compact) + "\n")
+            pairs += 1
+
+    os.replace(answers_path + ".tmp", answers_path)
+    os.replace(pairs_path_out + ".tmp", pairs_path_out)
+    return pairs, len(seen)
+
+
+def load_answers(compact_dir):
+    return {row["id"]: row["output"] for row in iter_records(os.path.join(compact_dir, ANSWERS_FILE))}
+
+
+def iter_alpaca(compact_dir, answers=None):
+    # Expands the compact set back to Alpaca pairs in their original order
+    if answers is None:
+        answers = load_answers(compact_dir)
+    for pair in iter_records(os.path.join(compact_dir, PAIRS_FILE)):
+        expanded = {k: v for k, v in pair.items() if k != "answer"}
+        expanded["output"] = answers[pair["answer"]]
+        yield expanded
+
+
+def export_alpaca(compact_dir, output_path):
+    return write_records(output_path, iter_alpaca(compact_dir))
+
+
+def answer_counts(compact_dir):
+    # Questions per answer id; only reads the small pairs file
+    return Counter(pair["answer"] for pair in iter_records(os.path.join(compact_dir, PAIRS_FILE)))
+
+
+def file_size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deduplicated answer store for the training pairs")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("compact", help="Alpaca JSONL -> answer table + pairs")
+    p.add_argument("--input", default="data/training/ff6_training_pairs.jsonl")
+    p.add_argument("--output", default="data/training/compact")
+
+    p = sub.add_parser("export", help="answer table + pairs -> Alpaca JSONL")
+    p.add_argument("--input", default="data/training/compact")
+    p.add_argument("--output", default="data/training/ff6_training_pairs.jsonl")
+
+    p = sub.add_parser("counts", help="how many questions map to each answer")
+    p.add_argument("--input", default="data/training/compact")
+    p.add_argument("--top", type=int, default=10)
+
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        pairs, answers = compact_pairs(args.input, args.output)
+        before = file_size(args.input)
+        after = file_size(os.path.join(args.output, ANSWERS_FILE)) + file_size(os.path.join(args.output, PAIRS_FILE))
+        print(f"Compacted {pairs} pairs into {answers} unique answers in {args.output}")
+        if before:
+            print(f"Size: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({100 * after / before:.0f}%)")
+
+    elif args.command == "export":
+        count = export_alpaca(args.input, args.output)
+        print(f"Exported {count} pairs to {args.output}")
+
+    else:
+        counts = answer_counts(args.input)
+        answers = load_answers(args.input)
+        total = sum(counts.values())
+        print(f"{total} pairs over {len(counts)} answers ({total / max(1, len(counts)):.2f} questions per answer)")
+        spread = Counter(counts.values())
+        for questions in sorted(spread):
+            print(f"  {spread[questions]} answers with {questions} question(s)")
+        print("\nMost asked answers:")
+        for key, count in counts.most_common(args.top):
+            preview = answers[key][:70].replace("\n", " ")
+            print(f"  {count}  {key}  {preview}")
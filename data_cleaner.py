@@ -1,6 +1,14 @@
-import json
+import argparse
+import hashlib
+import inspect
 import re
 import os
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from record_io import iter_records, write_records
+from section_cache import SectionCache
 
 SKIP_HEADINGS = {
     "citations", "see also", "external links",
@@ -16,125 +24,494 @@ SKIP_HEADINGS = {
 }
 
 
-def clean_text(text):
+# Compiled once at import. Every pass below is guarded by a substring test
+# that any match must contain, so passes that can't fire cost one C-speed
+# scan instead of a regex walk over the whole section.
+REF_RE = re.compile(r'<ref[^>]*>.*?</ref>', re.DOTALL)
+REF_SELF_CLOSING_RE = re.compile(r'<ref[^>]*/>')
+GALLERY_RE = re.compile(r'<gallery>.*?</gallery>', re.DOTALL)
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+FILE_LINK_RE = re.compile(r'\[\[File:[^\]]*\]\]')
+IMAGE_LINK_RE = re.compile(r'\[\[Image:[^\]]*\]\]')
+PIPED_LINK_RE = re.compile(r'\[\[[^\]|]*\|([^\]]*)\]\]')
+LINK_RE = re.compile(r'\[\[([^\]]*)\]\]')
+EXTERNAL_LINK_TEXT_RE = re.compile(r'\[https?://[^\s\]]+\s([^\]]+)\]')
+EXTERNAL_LINK_RE = re.compile(r'\[https?://[^\]]+\]')
+TABLE_LINE_RE = re.compile(r'^\s*[|!].*$', re.MULTILINE)
+HEADING_RE = re.compile(r'={2,6}[^=]+=+')
+CATEGORY_RE = re.compile(r'\[\[Category:[^\]]*\]\]')
+INTERWIKI_RE = re.compile(r'\[\[[a-z\-]+:[^\]]*\]\]')
+NAMED_TEMPLATE_RES = [
+    re.compile(r'\{\{navbox[^}]*\}\}', re.IGNORECASE),
+    re.compile(r'\{\{citations\}\}', re.IGNORECASE),
+    re.compile(r'\{\{spoiler[^}]*\}\}', re.IGNORECASE),
+    re.compile(r'\{\{endspoiler\}\}', re.IGNORECASE),
+    re.compile(r'\{\{Quote\|[^}]*\}\}', re.IGNORECASE),
+    re.compile(r'\{\{[Ss]ee\|[^}]*\}\}', re.IGNORECASE),
+    re.compile(r'\{\{main\|[^}]*\}\}', re.IGNORECASE),
+]
+TABLE_ROW_RE = re.compile(r'\[TABLE ROW:[^\]]*\]')
+CAPTION_LINE_RE = re.compile(r'^\s*\.\]\]\s*', re.MULTILINE)
+# A match can only start where a run of non-space characters starts, so the
+# lookbehind skips the quadratic \S+ retries from inside long words
+IMAGE_NAME_RES = [
+    ('.png|', re.compile(r'(?<!\S)\S+\.png\|[^\n]+')),
+    ('.gif|', re.compile(r'(?<!\S)\S+\.gif\|[^\n]+')),
+    ('.jpg|', re.compile(r'(?<!\S)\S+\.jpg\|[^\n]+')),
+]
+BULLET_RE = re.compile(r'^\s*\*+\s*', re.MULTILINE)
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+SPACES_RE = re.compile(r' {2,}')
+BLOCK_TOKEN_RE = re.compile(r'\{\{\{?|\}\}|\{\||\|\}')
+TEMPLATE_NAME_RE = re.compile(r'[^|{}\n\0]*')
+# A template with no braces inside, not part of a {{{parameter}}} (checked
+# after the braces so the regex can scan for them as a literal). Possessive
+# runs keep an unclosed {{ from backtracking over the text after it.
+INNER_TEMPLATE_RE = re.compile(r'\{\{(?<!\{\{\{)([^|{}\n\0]*+)[^{}]*+\}\}')
+
+# Characters of a subsection's cleaned text used to find it in the section
+SUBSECTION_PROBE = 40
+
+# Pages per task when cleaning in a process pool
+CHUNK_SIZE = 16
+
+
+def template_key(name):
+    return name.strip().replace('_', ' ').lower() or '(unnamed)'
+
+
+def strip_blocks(text, counts=None):
+    # Removes balanced {{templates}}, {{{parameters}}} and {| tables |} of any
+    # depth in one left to right scan with a stack. Unbalanced openers are left
+    # in place, but complete blocks inside them are still removed. When
+    # `counts` is given it is incremented per template name ("table" for
+    # tables), nested ones included.
+    if '{{' not in text and '{|' not in text:
+        return text
+
+    # Innermost templates go first, a level per pass, at regex speed: split()
+    # returns the text between them and their names in one scan. Each becomes
+    # a NUL placeholder rather than being cut out, so the text around it
+    # can't join into a new brace token and the scan below pairs the
+    # remaining tokens exactly as it would have in the original text. Wiki
+    # text has no NULs of its own; any stray one is dropped.
+    text = text.replace('\0', '')
+    while True:
+        parts = INNER_TEMPLATE_RE.split(text)
+        if len(parts) == 1:
+            break
+        text = '\0'.join(parts[::2])
+        if counts is not None:
+            for name, count in Counter(parts[1::2]).items():
+                counts[template_key(name)] += count
+    if '{{' not in text and '{|' not in text:
+        return text.replace('\0', '')
+
+    stack = []
+    spans = []
+    search = BLOCK_TOKEN_RE.search
+    pos = 0
+    while True:
+        match = search(text, pos)
+        if not match:
+            break
+        token = match.group()
+        start = match.start()
+        pos = match.end()
+
+        if token[0] == '{':
+            stack.append((token, start))
+            continue
+        if not stack:
+            continue
+
+        opener, open_at = stack[-1]
+        if token == '|}' and opener != '{|':
+            # The pipe of {{name|}}: rescan from the brace after it
+            pos = start + 1
+            continue
+        if token == '}}' and opener == '{{{':
+            # Parameters close with three braces
+            if text.startswith('}', pos):
+                pos += 1
+        elif (token == '}}') != (opener == '{{'):
+            continue
+
+        stack.pop()
+        spans.append((open_at, pos))
+        if counts is not None:
+            if opener == '{|':
+                counts['table'] += 1
+            elif opener == '{{':
+                counts[template_key(TEMPLATE_NAME_RE.match(text, open_at + 2).group())] += 1
+
+    if not spans:
+        return text.replace('\0', '')
+
+    # Inner blocks close first, so sort by start and keep only outermost spans
+    spans.sort()
+    pieces = []
+    last_end = 0
+    for start, end in spans:
+        if start >= last_end:
+            pieces.append(text[last_end:start])
+            last_end = end
+    pieces.append(text[last_end:])
+    return ''.join(pieces).replace('\0', '')
+
+
+def clean_text(text, counts=None):
+    # Same passes in the same order as the original cascade, except that
+    # templates and tables go through strip_blocks; `python benchmark.py clean`
+    # checks the output against the reference. `counts` collects removed
+    # template names.
+    return tidy_text(strip_markup(text, counts))
+
+
+def strip_markup(text, counts=None):
+    # The passes before headings are removed: refs, tags, templates, tables,
+    # links and bold/italic quotes
+
     # Remove ref tags and their contents
-    text = re.sub(r'<ref[^>]*>.*?</ref>', '', text, flags=re.DOTALL)
-    text = re.sub(r'<ref[^>]*/>', '', text)
+    if '<ref' in text:
+        text = REF_RE.sub('', text)
+        text = REF_SELF_CLOSING_RE.sub('', text)
 
     # Remove gallery blocks
-    text = re.sub(r'<gallery>.*?</gallery>', '', text, flags=re.DOTALL)
+    if '<gallery>' in text:
+        text = GALLERY_RE.sub('', text)
 
     # Remove HTML tags
-    text = re.sub(r'<[^>]+>', '', text)
-
-    # Remove infobox/template blocks (multiple passes for nesting)
-    for _ in range(5):
-        text = re.sub(r'\{\{[^{}]*\}\}', '', text)
+    if '<' in text:
+        text = HTML_TAG_RE.sub('', text)
 
-    # Remove file/image links
-    text = re.sub(r'\[\[File:[^\]]*\]\]', '', text)
-    text = re.sub(r'\[\[Image:[^\]]*\]\]', '', text)
+    # Remove infobox/template blocks and tables, however deeply nested
+    text = strip_blocks(text, counts)
 
-    # Convert [[link|display]] to display text
-    text = re.sub(r'\[\[[^\]|]*\|([^\]]*)\]\]', r'\1', text)
+    if '[[' in text:
+        # Remove file/image links
+        if '[[File:' in text:
+            text = FILE_LINK_RE.sub('', text)
+        if '[[Image:' in text:
+            text = IMAGE_LINK_RE.sub('', text)
 
-    # Convert [[link]] to link text
-    text = re.sub(r'\[\[([^\]]*)\]\]', r'\1', text)
+        # Convert [[link|display]] to display text, then [[link]] to link text
+        text = PIPED_LINK_RE.sub(r'\1', text)
+        text = LINK_RE.sub(r'\1', text)
 
     # Remove external links [http://... text] -> text
-    text = re.sub(r'\[https?://[^\s\]]+\s([^\]]+)\]', r'\1', text)
-    text = re.sub(r'\[https?://[^\]]+\]', '', text)
+    if '[http' in text:
+        text = EXTERNAL_LINK_TEXT_RE.sub(r'\1', text)
+        text = EXTERNAL_LINK_RE.sub('', text)
+
+    # Remove leftover table row markup
+    if '|' in text or '!' in text:
+        text = TABLE_LINE_RE.sub('', text)
+    text = text.replace('|-', '')
+
+    # Remove wiki formatting. Taking '{2,3} greedily is the same as
+    # stripping every ''' and then every ''.
+    text = text.replace("'''", '').replace("''", '')
+    return text
 
-    # Remove table markup
-    text = re.sub(r'\{\|.*?\|\}', '', text, flags=re.DOTALL)
-    text = re.sub(r'^\s*[|!].*$', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\|-', '', text)
 
-    # Remove wiki formatting
-    text = re.sub(r"'{2,3}", '', text)
-    text = re.sub(r'={2,6}[^=]+=+', '', text)
+def tidy_text(text):
+    # The passes from heading removal on
+    if '==' in text:
+        text = HEADING_RE.sub('', text)
 
     # Remove category/navbox/language links
-    text = re.sub(r'\[\[Category:[^\]]*\]\]', '', text)
-    text = re.sub(r'\[\[[a-z\-]+:[^\]]*\]\]', '', text)
-    text = re.sub(r'\{\{navbox[^}]*\}\}', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\{\{citations\}\}', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\{\{spoiler[^}]*\}\}', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\{\{endspoiler\}\}', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\{\{Quote\|[^}]*\}\}', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\{\{[Ss]ee\|[^}]*\}\}', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'\{\{main\|[^}]*\}\}', '', text, flags=re.IGNORECASE)
+    if '[[' in text:
+        text = CATEGORY_RE.sub('', text)
+        text = INTERWIKI_RE.sub('', text)
+    if '{{' in text:
+        for pattern in NAMED_TEMPLATE_RES:
+            text = pattern.sub('', text)
 
     # Remove [TABLE ROW: ...] artifacts
-    text = re.sub(r'\[TABLE ROW:[^\]]*\]', '', text)
+    if '[TABLE ROW:' in text:
+        text = TABLE_ROW_RE.sub('', text)
 
     # Remove leftover image caption artifacts
-    text = re.sub(r'^\s*\.\]\]\s*', '', text, flags=re.MULTILINE)
-    text = re.sub(r'\.\]\]', '', text)
+    if '.]]' in text:
+        text = CAPTION_LINE_RE.sub('', text)
+        text = text.replace('.]]', '')
 
     # Remove image filename patterns
-    text = re.sub(r'\S+\.png\|[^\n]+', '', text)
-    text = re.sub(r'\S+\.gif\|[^\n]+', '', text)
-    text = re.sub(r'\S+\.jpg\|[^\n]+', '', text)
+    for marker, pattern in IMAGE_NAME_RES:
+        if marker in text:
+            text = pattern.sub('', text)
 
     # Clean up bullet asterisks
-    text = re.sub(r'^\s*\*+\s*', '- ', text, flags=re.MULTILINE)
+    if '*' in text:
+        text = BULLET_RE.sub('- ', text)
 
     # Clean up whitespace
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    text = re.sub(r' {2,}', ' ', text)
+    if '\n\n\n' in text:
+        text = BLANK_LINES_RE.sub('\n\n', text)
+    if '  ' in text:
+        text = SPACES_RE.sub(' ', text)
     text = text.strip()
 
     return text
 
 
-def clean_data(input_path, output_path):
-    with open(input_path, 'r', encoding='utf-8') as f:
-        raw_data = json.load(f)
-
-    cleaned_data = []
-
-    for page in raw_data:
-        cleaned_page = {
-            "title": page["title"],
-            "url": page["url"],
-            "sections": []
-        }
+def clean_section(text, counts=None):
+    # Returns (clean_text(text), subheadings), where subheadings is
+    # [{"heading", "start"}] for each inline === subheading, with start the
+    # offset of that subsection's text in the content, so long sections can
+    # be asked about piece by piece. Subheadings are found after refs,
+    # templates and tables are gone, as clean_text finds them, and each
+    # subsection is placed by finding its own cleaned opening in the content.
+    stripped = strip_markup(text, counts)
+    content = tidy_text(stripped)
+    if '==' not in stripped:
+        return content, []
+    matches = list(HEADING_RE.finditer(stripped))
+    subheadings = []
+    # Cleaning the pieces apart can only shorten them a little, so the text
+    # before a subsection bounds where its search starts
+    position = len(tidy_text(stripped[:matches[0].start()])) if matches else 0
+    for match, end in zip(matches, [m.start() for m in matches[1:]] + [len(stripped)]):
+        heading = tidy_text(match.group().strip('= '))
+        # Cleaned behind a word, as it sits mid-line in the whole section
+        body = tidy_text("x " + stripped[match.end():end])[2:]
+        opening = body[:SUBSECTION_PROBE]
+        start = content.find(opening, max(0, position - SUBSECTION_PROBE)) if heading and opening else -1
+        if start < 0:
+            continue
+        subheadings.append({"heading": heading, "start": start})
+        position = start + len(body)
+    return content, subheadings
+
+
+def fingerprint(text):
+    # Case, whitespace and punctuation differences don't make content distinct
+    normalized = re.sub(r'[\W_]+', ' ', text.lower()).strip()
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+
+def dedupe_pages(pages, stats):
+    # Drops redirect aliases (same pageid), pages whose whole text matches an
+    # earlier page, and sections that repeat one already seen on another page.
+    # Duplicate pages pass through empty and marked, so the caller can report
+    # them in order with the pages it cleans.
+    seen_pages = set()
+    seen_sections = set()
+
+    for page in pages:
+        page_keys = {fingerprint(" ".join(s["content"] for s in page["sections"]))}
+        if page.get("pageid") is not None:
+            page_keys.add(("pageid", page["pageid"]))
+        if page_keys & seen_pages:
+            stats["pages"] += 1
+            yield {**page, "sections": [], "duplicate": True}
+            continue
+        seen_pages |= page_keys
 
+        sections = []
         for section in page["sections"]:
-            # Skip unhelpful sections
-            if section["heading"].lower() in SKIP_HEADINGS:
+            key = fingerprint(section["content"])
+            if key in seen_sections:
+                stats["sections"] += 1
                 continue
+            seen_sections.add(key)
+            sections.append(section)
+
+        yield {**page, "sections": sections}
+
+
+def rules_fingerprint():
+    # Changes whenever the cleaning functions or one of the patterns
+    # changes. SKIP_HEADINGS and the length thresholds are applied outside
+    # clean_text, so editing them keeps cached sections valid.
+    parts = [inspect.getsource(f) for f in (clean_text, strip_markup, tidy_text, clean_section, strip_blocks)]
+    for name, value in sorted(globals().items()):
+        if name.endswith(('_RE', '_RES')):
+            parts.append(f"{name}={value!r}")
+    parts.append(f"SUBSECTION_PROBE={SUBSECTION_PROBE}")
+    return hashlib.sha256("\n".join(parts).encode('utf-8')).hexdigest()
+
+
+def section_key(text, rules):
+    return hashlib.sha256(f"{rules}\0{text}".encode('utf-8')).hexdigest()
+
+
+def clean_page(page, cached=None):
+    # Pure per-page work so it can run in a worker process. `cached` maps
+    # section indexes to (content, counts, subheadings) already looked up in
+    # the section cache. Returns the cleaned page, its template counts and the
+    # sections cleaned here as {index: (content, counts, subheadings)};
+    # printing is left to the caller so the log stays in input order.
+    cached = cached or {}
+    template_counts = Counter()
+    fresh = {}
+    cleaned_page = {
+        "title": page["title"],
+        "url": page["url"],
+        "sections": []
+    }
+
+    for i, section in enumerate(page["sections"]):
+        # Skip unhelpful sections
+        if section["heading"].lower() in SKIP_HEADINGS:
+            continue
 
-            cleaned_content = clean_text(section["content"])
+        if i in cached:
+            cleaned_content, counts, subheadings = cached[i]
+        else:
+            counts = Counter()
+            cleaned_content, subheadings = clean_section(section["content"], counts)
+            fresh[i] = (cleaned_content, counts, subheadings)
+        template_counts.update(counts)
 
-            # Skip sections that are basically empty after cleaning
-            if len(cleaned_content) < 20:
+        # Skip sections that are basically empty after cleaning
+        if len(cleaned_content) < 20:
+            continue
+
+        cleaned_section = {
+            "heading": section["heading"],
+            "content": cleaned_content,
+            "versions": section["versions"]
+        }
+        if subheadings:
+            cleaned_section["subheadings"] = subheadings
+        cleaned_page["sections"].append(cleaned_section)
+
+    return cleaned_page, template_counts, fresh
+
+
+def clean_chunk(jobs):
+    return [clean_page(page, cached) for page, cached in jobs]
+
+
+def lookup_sections(page, cache, rules):
+    # Section keys for the page and the cached results among them. Cached
+    # sections are blanked in the copy sent to a worker, so only misses are
+    # pickled across.
+    keys = {
+        i: section_key(section["content"], rules)
+        for i, section in enumerate(page["sections"])
+        if section["heading"].lower() not in SKIP_HEADINGS
+    }
+    found = cache.get_many(keys.values())
+    cached = {i: found[key] for i, key in keys.items() if key in found}
+    if cached:
+        page = {**page, "sections": [
+            {**section, "content": ""} if i in cached else section
+            for i, section in enumerate(page["sections"])
+        ]}
+    return keys, page, cached
+
+
+def clean_pages(pages, workers=1, chunk_size=CHUNK_SIZE, cache=None):
+    # Yields (page, cleaned_page, template_counts) in input order. With more
+    # than one worker, pages are sent to a process pool in chunks (one
+    # pickle round trip per chunk rather than per page), with a bounded
+    # number of chunks in flight so `pages` can be a lazy iterator. Cache
+    # lookups and writes happen here in the main process, committed once per
+    # chunk so an interrupted run keeps what it cleaned.
+    rules = rules_fingerprint() if cache is not None else None
+
+    def prepare(page):
+        if cache is None:
+            return page, {}, (page, None)
+        keys, job_page, cached = lookup_sections(page, cache, rules)
+        return page, keys, (job_page, cached)
+
+    def finish(page, keys, result):
+        cleaned_page, template_counts, fresh = result
+        if cache is not None and fresh:
+            cache.put_many((keys[i], *cleaned) for i, cleaned in fresh.items())
+        return page, cleaned_page, template_counts
+
+    if workers <= 1:
+        for n, page in enumerate(pages, 1):
+            page, keys, job = prepare(page)
+            yield finish(page, keys, clean_page(*job))
+            if cache is not None and n % chunk_size == 0:
+                cache.commit()
+        return
+
+    pages = iter(pages)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        while True:
+            chunk = [prepare(page) for page in islice(pages, chunk_size)]
+            if chunk:
+                jobs = [job for _, _, job in chunk]
+                pending.append((chunk, executor.submit(clean_chunk, jobs)))
+            if pending and (not chunk or len(pending) >= workers * 2):
+                done_chunk, future = pending.popleft()
+                for (page, keys, _), result in zip(done_chunk, future.result()):
+                    yield finish(page, keys, result)
+                if cache is not None:
+                    cache.commit()
+            elif not chunk:
+                break
+
+
+def clean_data(input_path, output_path, workers=1, cache_path=None, cache_mb=256):
+    # Accepts the raw JSON array or the streamed JSONL, one page at a time,
+    # and writes each cleaned page as soon as it is ready
+    duplicates = {"pages": 0, "sections": 0}
+    template_counts = Counter()
+    cache = SectionCache(cache_path, cache_mb) if cache_path else None
+
+    def cleaned_pages():
+        pages = dedupe_pages(iter_records(input_path), duplicates)
+        for page, cleaned_page, page_counts in clean_pages(pages, workers, cache=cache):
+            template_counts.update(page_counts)
+
+            if page.get("duplicate"):
+                print(f"  -> Skipping duplicate page: {page['title']}")
                 continue
 
-            cleaned_page["sections"].append({
-                "heading": section["heading"],
-                "content": cleaned_content,
-                "versions": section["versions"]
-            })
+            # Skip disambiguation or near-empty pages
+            total_content = " ".join(s["content"] for s in cleaned_page["sections"])
+            if len(total_content) < 50:
+                print(f"  -> Skipping (too little content): {page['title']} ({len(total_content)} chars)")
+                continue
 
-        # Skip disambiguation or near-empty pages
-        total_content = " ".join(s["content"] for s in cleaned_page["sections"])
-        if len(total_content) < 50:
-            print(f"  -> Skipping (too little content): {page['title']} ({len(total_content)} chars)")
-            continue
+            if cleaned_page["sections"]:
+                yield cleaned_page
+
+            print(f"Cleaned: {page['title']} -> {len(cleaned_page['sections'])} sections")
 
-        if cleaned_page["sections"]:
-            cleaned_data.append(cleaned_page)
+    try:
+        saved = write_records(output_path, cleaned_pages())
+    finally:
+        if cache is not None:
+            cache.close()
 
-        print(f"Cleaned: {page['title']} -> {len(cleaned_page['sections'])} sections")
+    print(f"\nDone! Saved {saved} pages to {output_path}")
+    print(f"Dropped {duplicates['pages']} duplicate pages and {duplicates['sections']} duplicate sections")
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(cleaned_data, f, indent=2, ensure_ascii=False)
+    if cache is not None:
+        looked_up = cache.hits + cache.misses
+        rate = 100 * cache.hits / looked_up if looked_up else 0
+        print(f"Section cache: {cache.hits} hits, {cache.misses} misses ({rate:.1f}% served from cache)")
+        if cache.evicted:
+            print(f"  evicted {cache.evicted} least recently used sections to stay under {cache_mb} MB")
 
-    print(f"\nDone! Saved {len(cleaned_data)} pages to {output_path}")
+    print(f"Removed {sum(template_counts.values())} templates/tables. Most common:")
+    for name, count in template_counts.most_common(10):
+        print(f"  {name}: {count}")
 
 
 if __name__ == "__main__":
-    clean_data("data/raw/ff6_wiki_raw.json", "data/cleaned/ff6_wiki_cleaned.json")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Clean raw FF6 wiki markup")
+    parser.add_argument("--input", default="data/raw/ff6_wiki_raw.json",
+                        help="raw scrape (.json array or streamed .jsonl)")
+    parser.add_argument("--output", default="data/cleaned/ff6_wiki_cleaned.jsonl",
+                        help=".jsonl (default) or .json array")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="cleaning processes (1 cleans in this process)")
+    parser.add_argument("--cache", default="data/cache/cleaned_sections.sqlite",
+                        help="cleaned-section cache reused across runs")
+    parser.add_argument("--no-cache", action="store_true", help="clean every section from scratch")
+    parser.add_argument("--cache-mb", type=float, default=256,
+                        help="evict least recently used sections beyond this size")
+    args = parser.parse_args()
+    clean_data(args.input, args.output, args.workers,
+               cache_path=None if args.no_cache else args.cache, cache_mb=args.cache_mb)
@@ -0,0 +1,129 @@
+import asyncio
+import random
+import time
+
+from anthropic import APIConnectionError
+
+from scrape_engine import retry_after_seconds
+
+# 529 is the API's "overloaded"; 408/409 are documented as safe to retry
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# USD per million tokens, matched on model name prefix
+PRICING = {
+    "claude-haiku-4-5": {"input": 1.00, "output": 5.00},
+}
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+BATCH_DISCOUNT = 0.5
+
+USAGE_FIELDS = ["input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens"]
+
+
+def usage_dict(usage):
+    # Token counts from an API usage object or a stored dict, None as 0
+    get = usage.get if isinstance(usage, dict) else lambda name: getattr(usage, name, None)
+    return {name: get(name) or 0 for name in USAGE_FIELDS}
+
+
+def usage_cost(model, usage, batch=False):
+    # Estimated USD for one response; unknown models cost nothing rather than
+    # guessing
+    prices = next((p for prefix, p in PRICING.items() if model.startswith(prefix)), None)
+    if prices is None:
+        return 0.0
+    usage = usage_dict(usage)
+    cost = (usage["input_tokens"] * prices["input"]
+            + usage["cache_creation_input_tokens"] * prices["input"] * CACHE_WRITE_MULTIPLIER
+            + usage["cache_read_input_tokens"] * prices["input"] * CACHE_READ_MULTIPLIER
+            + usage["output_tokens"] * prices["output"]) / 1_000_000
+    return cost * BATCH_DISCOUNT if batch else cost
+
+
+class ExpansionError(Exception):
+    # A request that failed for good, after `attempts` tries
+    def __init__(self, cause, attempts):
+        super().__init__(f"{type(cause).__name__}: {cause}")
+        self.cause = cause
+        self.attempts = attempts
+
+
+def is_retryable(error):
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, (APIConnectionError, ConnectionError, asyncio.TimeoutError))
+
+
+class ExpansionEngine:
+    # Runs Messages API calls on an async client with at most `concurrency`
+    # requests in flight. Retryable errors back off exponentially with
+    # jitter; a Retry-After from a 429/529 pauses every request, not just the
+    # one that got it, like TokenBucket.pause in scrape_engine. `client` is
+    # anything with an awaitable messages.create(**params), so tests can pass
+    # a fake. It must not retry internally (build AsyncAnthropic with
+    # max_retries=0): the engine has to see every failed call for attempts,
+    # latency and the shared Retry-After pause to be right.
+    def __init__(self, client, concurrency=8, max_retries=5, backoff=1.0, max_backoff=60.0):
+        self.client = client
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.paused_until = 0.0
+        self.retries = 0
+
+    def backoff_delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return delay * random.uniform(0.5, 1.0)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def wait_for_pause(self):
+        while True:
+            wait = self.paused_until - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    async def create(self, params):
+        # Returns (response, attempts, latency of the successful call)
+        attempt = 0
+        while True:
+            await self.wait_for_pause()
+            async with self.semaphore:
+                started = time.monotonic()
+                try:
+                    response = await self.client.messages.create(**params)
+                except Exception as e:
+                    if not is_retryable(e) or attempt >= self.max_retries:
+                        raise ExpansionError(e, attempt + 1) from e
+                    error = e
+                else:
+                    return response, attempt + 1, time.monotonic() - started
+
+            response = getattr(error, "response", None)
+            delay = retry_after_seconds(response) if response is not None else None
+            if delay is None:
+                delay = self.backoff_delay(attempt)
+            else:
+                self.pause(delay)
+            status = getattr(error, "status_code", type(error).__name__)
+            print(f"  -> {status}, retrying in {delay:.1f}s")
+            self.retries += 1
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def map(self, fn, items):
+        # Awaits fn(item) for every item. Twice `concurrency` workers pull
+        # from one iterator, so items are consumed lazily and requests that
+        # are backing off don't hold the other slots idle.
+        items = iter(items)
+
+        async def worker():
+            for item in items:
+                await fn(item)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency * 2)))
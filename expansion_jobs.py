@@ -0,0 +1,60 @@
+import hashlib
+
+from chunking import chunk_text, estimate_tokens
+from record_io import iter_records
+from training_pair_generator import clean_title, load_templates
+
+# Content per request. About the old 800-character cut, but split on
+# sentences, and every part of a long section gets its own request.
+PROMPT_CHUNK_TOKENS = 200
+
+
+def section_chunks(content, count_tokens=estimate_tokens):
+    return chunk_text(content, PROMPT_CHUNK_TOKENS, count_tokens=count_tokens)
+
+
+def prompt_title(title):
+    # The title shown in prompts and hashed into section_key. Unlike
+    # training_pair_generator.clean_title it keeps a bare "Final Fantasy VI";
+    # it stays as it is so existing section keys, checkpoints and cached
+    # responses still match.
+    title = title.replace("_", " ").replace("(Final Fantasy VI)", "").strip()
+    return title.replace("(summon)", "").replace("(command)", "").strip()
+
+
+def section_key(title, heading, chunk):
+    # Stable id for one request's worth of content; changes if the text does
+    return hashlib.sha1(f"{title}\0{heading}\0{chunk}".encode("utf-8")).hexdigest()[:16]
+
+
+def iter_jobs(cleaned_json, registry=None):
+    # One job per section chunk, in corpus order. The questions the prompt
+    # asks the model not to repeat are the template questions
+    # training_pair_generator produced for the same section, so the prompt
+    # (and its response cache key) is the same on every run.
+    registry = registry or load_templates()
+    for page in iter_records(cleaned_json):
+        title = prompt_title(page["title"])
+        generator_title = clean_title(page["title"])
+
+        for section in page["sections"]:
+            content = section["content"]
+            heading = section["heading"]
+
+            # Skip very short sections
+            if len(content) < 50:
+                continue
+
+            h = heading.lower()
+            avoid = [t.format(title=generator_title, heading=heading, h=h) for t in registry.lookup(h)][:5]
+
+            chunks = section_chunks(content)
+            for part, chunk in enumerate(chunks, 1):
+                yield {
+                    "key": section_key(title, heading, chunk),
+                    "title": title,
+                    "heading": heading,
+                    "label": f" (part {part} of {len(chunks)})" if len(chunks) > 1 else "",
+                    "chunk": chunk,
+                    "avoid": avoid,
+                }
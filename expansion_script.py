@@ -1,108 +1,647 @@
 # DANGER THIS SCRIPT COSTS MONEY
 
+import argparse
+import asyncio
 import json
 import os
 import time
 import anthropic
 from dotenv import load_dotenv
 
-load_dotenv()
+from chunking import estimate_tokens
+from expansion_engine import ExpansionEngine, ExpansionError, usage_cost, usage_dict
+from expansion_jobs import iter_jobs
+from record_io import JsonlAppender, iter_records
+from response_cache import ResponseCache
+from training_pair_generator import load_templates
 
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# Near-duplicate question filtering needs NumPy; without it only exact
+# repeats are skipped
+try:
+    from near_dedup import THRESHOLD as NEAR_THRESHOLD, QuestionSet, collect_names
+except ImportError:
+    QuestionSet = None
+    NEAR_THRESHOLD = 0.7
 
-def expand_pairs(input_jsonl, cleaned_json, output_jsonl):
-    # Load existing pairs so we don't duplicate
-    existing_instructions = set()
-    with open(input_jsonl, 'r', encoding='utf-8') as f:
-        for line in f:
-            pair = json.loads(line)
-            existing_instructions.add(pair["instruction"])
-
-    # Load cleaned data
-    with open(cleaned_json, 'r', encoding='utf-8') as f:
-        cleaned_data = json.load(f)
-
-    new_pairs = []
-    total_sections = sum(len(p["sections"]) for p in cleaned_data)
-    processed = 0
-
-    for page in cleaned_data:
-        title = page["title"].replace("_", " ").replace("(Final Fantasy VI)", "").strip()
-        title = title.replace("(summon)", "").replace("(command)", "").strip()
-
-        for section in page["sections"]:
-            content = section["content"]
-            heading = section["heading"]
-
-            # Skip very short sections
-            if len(content) < 50:
-                continue
+load_dotenv()
 
-            processed += 1
-            print(f"Processing ({processed}/{total_sections}): {title} - {heading}")
+MODEL = "claude-haiku-4-5-20251001"
+MAX_TOKENS = 600
+CONCURRENCY = 8
+# Per-request outcomes. Sections logged as "ok" are the checkpoint: later
+# runs skip them unless --replay is given.
+LOG_PATH = "data/training/expansion_log.jsonl"
+RESPONSE_CACHE_PATH = "data/cache/expansion_responses.sqlite"
+# Token counts, latency and estimated cost of every API call
+METRICS_PATH = "data/training/expansion_metrics.jsonl"
 
-            prompt = f"""You are helping build a question/answer training dataset for a Final Fantasy VI game guide AI.
+# With --pack, consecutive sections share one request up to this much
+# section text, answered as one JSON object keyed by section id
+PACK_TOKENS = 1500
+PACK_SECTIONS = 8
 
-Given this content about "{title}" (section: "{heading}"):
 
-{content[:800]}
+# The instructions are identical for every request, so they go first, in the
+# system prompt, marked for prompt caching; only the section follows. Caching
+# only applies once the marked prefix reaches the model's minimum length
+# (several thousand tokens on Haiku), so below that the API silently bills it
+# as normal input. The metrics file shows which is happening.
+SYSTEM_PROMPT = """You are helping build a question/answer training dataset for a Final Fantasy VI game guide AI.
 
-Generate 3 natural questions a player might ask about this, along with their answers based only on the content above.
+You will be given content about one topic from the game wiki, with the section it comes from. Generate 3 natural questions a player might ask about it, along with their answers based only on that content.
 Format your response as JSON array like this:
 [
-  {{"question": "...", "answer": "..."}},
-  {{"question": "...", "answer": "..."}},
-  {{"question": "...", "answer": "..."}}
+  {"question": "...", "answer": "..."},
+  {"question": "...", "answer": "..."},
+  {"question": "...", "answer": "..."}
 ]
 
 Rules:
 - Questions should be natural things a player would ask
 - Answers should be based only on the provided content
-- Do not repeat these existing questions: {list(existing_instructions)[:5]}
+- Do not repeat the existing questions listed after the content
 - Return ONLY the JSON array, no other text"""
 
+
+def build_prompt(title, heading, chunk, avoid, label=""):
+    return f"""Content about "{title}" (section: "{heading}"{label}):
+
+{chunk}
+
+Existing questions: {avoid}"""
+
+
+# Packed requests: same task, several sections, one answer object
+PACKED_SYSTEM_PROMPT = """You are helping build a question/answer training dataset for a Final Fantasy VI game guide AI.
+
+You will be given several sections of content from the game wiki, each starting with a section id like [s1]. For every section, generate 3 natural questions a player might ask about it, along with their answers based only on that section's content.
+Format your response as a JSON object with one key per section id, like this:
+{
+  "s1": [
+    {"question": "...", "answer": "..."},
+    {"question": "...", "answer": "..."},
+    {"question": "...", "answer": "..."}
+  ],
+  "s2": [...]
+}
+
+Rules:
+- Questions should be natural things a player would ask
+- Answers should be based only on the content of their own section
+- Do not repeat the existing questions listed after each section
+- Include every section id exactly once
+- Return ONLY the JSON object, no other text"""
+
+
+def pack_jobs(jobs, max_tokens=PACK_TOKENS, max_sections=PACK_SECTIONS):
+    # Groups consecutive jobs, in order, while their prompts fit the budget.
+    # A job over the budget on its own still gets a group.
+    group = []
+    used = 0
+    for job in jobs:
+        tokens = estimate_tokens(build_prompt(job["title"], job["heading"], job["chunk"], job["avoid"], job["label"]))
+        if group and (used + tokens > max_tokens or len(group) >= max_sections):
+            yield group
+            group = []
+            used = 0
+        group.append(job)
+        used += tokens
+    if group:
+        yield group
+
+
+def packed_params(group):
+    sections = [f"[s{i}] " + build_prompt(job["title"], job["heading"], job["chunk"], job["avoid"], job["label"])
+                for i, job in enumerate(group, 1)]
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS * len(group),
+        "system": [{"type": "text", "text": PACKED_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+        "messages": [{"role": "user", "content": "\n\n---\n\n".join(sections)}]
+    }
+
+
+def parse_packed(text, count):
+    # One list of {"question", "answer"} per section, in order; ValueError
+    # unless every section id came back as a list
+    text = text.strip()
+    text = text.replace("```json", "").replace("```", "").strip()
+    generated = json.loads(text)
+    if not isinstance(generated, dict):
+        raise ValueError("expected a JSON object")
+    sections = []
+    for i in range(1, count + 1):
+        items = generated.get(f"s{i}")
+        if not isinstance(items, list):
+            raise ValueError(f"no list for section s{i}")
+        sections.append([item for item in items if isinstance(item, dict)])
+    return sections
+
+
+def parse_generated(text):
+    # [{"question", "answer"}, ...] from the model's reply; ValueError if not
+    text = text.strip()
+    # Strip markdown code blocks if present
+    text = text.replace("```json", "").replace("```", "").strip()
+    generated = json.loads(text)
+    if not isinstance(generated, list):
+        raise ValueError("expected a JSON array")
+    return [item for item in generated if isinstance(item, dict)]
+
+
+def request_params(job):
+    prompt = build_prompt(job["title"], job["heading"], job["chunk"], job["avoid"], job["label"])
+    return {
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "system": [{"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}],
+        "messages": [{"role": "user", "content": prompt}]
+    }
+
+
+def add_pairs(generated, existing_instructions, output, source=None):
+    # `source` is the section key, kept on each pair so grounding_filter can
+    # check the answer against the section it was generated from
+    added = 0
+    for item in generated:
+        q = str(item.get("question", "")).strip()
+        a = str(item.get("answer", "")).strip()
+        if q and a and q not in existing_instructions:
+            pair = {
+                "instruction": q,
+                "input": "",
+                "output": a
+            }
+            if source:
+                pair["source"] = source
+            output.write(pair)
+            added += 1
+            existing_instructions.add(q)
+    output.checkpoint()
+    return added
+
+
+class ExactQuestions(set):
+    # Exact-only stand-in for QuestionSet, ignoring case
+    def __contains__(self, question):
+        return set.__contains__(self, " ".join(question.casefold().split()))
+
+    def add(self, question):
+        set.add(self, " ".join(question.casefold().split()))
+
+
+def load_existing_instructions(input_jsonl, near_threshold=NEAR_THRESHOLD):
+    # Questions already in the dataset; new questions that are in here, or
+    # close paraphrases of one, are not added. Names for the near-duplicate
+    # check come from the existing questions and answers.
+    pairs = list(iter_records(input_jsonl))
+    questions = [pair["instruction"] for pair in pairs]
+    if near_threshold and QuestionSet is None:
+        print("  -> NumPy not installed; only exact duplicate questions are skipped")
+    if not near_threshold or QuestionSet is None:
+        exact = ExactQuestions()
+        for question in questions:
+            exact.add(question)
+        return exact
+    names = collect_names(pair["output"] for pair in pairs)
+    return QuestionSet(questions, near_threshold, names)
+
+
+def print_near_duplicates(existing_instructions):
+    if QuestionSet is not None and isinstance(existing_instructions, QuestionSet):
+        print(f"{existing_instructions.near_duplicates} generated questions skipped as near-duplicates")
+
+
+def new_outcome(job):
+    return {"key": job["key"], "title": job["title"], "heading": job["heading"] + job["label"]}
+
+
+def new_stats():
+    return {"done": 0, "ok": 0, "failed": 0, "pairs": 0, "spent": 0.0, "saved": 0.0, "calls": []}
+
+
+def record_call(keys, params, usage, latency, stats, cached=False, batch=False, metrics=None):
+    # Adds one response's price to the run totals and, for fresh responses,
+    # logs its metrics row. Cached ones count their original price as saved.
+    cost = usage_cost(params["model"], usage, batch)
+    if cached:
+        stats["saved"] += cost
+        return cost
+    stats["spent"] += cost
+    call = {"key": keys[0] if len(keys) == 1 else keys, "model": params["model"], "batch": batch,
+            **usage_dict(usage), "latency": latency, "cost": round(cost, 6)}
+    stats["calls"].append(call)
+    if metrics is not None:
+        metrics.write(call)
+    return cost
+
+
+def record_completion(job, params, text, usage, outcome, stats, existing_instructions, output,
+                      cache=None, cached=False, batch=False, metrics=None):
+    # Parses one completion, appends its new pairs and fills in the outcome.
+    # Fresh completions that parse are stored in the cache.
+    cost = record_call([job["key"]], params, usage, outcome.get("latency"), stats, cached, batch, metrics)
+    outcome.update(cached=cached, cost=round(cost, 6))
+    try:
+        generated = parse_generated(text)
+    except ValueError as e:
+        outcome.update(status="parse_error", error=f"{type(e).__name__}: {e}")
+        return 0
+    if cache is not None and not cached:
+        cache.put(params, text, usage_dict(usage))
+    added = add_pairs(generated, existing_instructions, output, job["key"])
+    outcome.update(status="ok", pairs=added)
+    stats["pairs"] += added
+    return added
+
+
+def finish_outcome(outcome, stats, log):
+    log.write(outcome)
+    log.checkpoint()
+    stats["done"] += 1
+    stats["ok" if outcome["status"] == "ok" else "failed"] += 1
+
+
+def load_checkpoint(log_path):
+    # Keys of requests whose pairs are already in the output
+    if not os.path.exists(log_path):
+        return set()
+    return {record["key"] for record in iter_records(log_path) if record.get("status") == "ok"}
+
+
+def print_costs(stats, cache):
+    if cache is not None:
+        print(f"Response cache: {cache.hits} hits, {cache.misses} misses")
+    print(f"Estimated spend ${stats['spent']:.4f}, saved ${stats['saved']:.4f} by replaying cached responses")
+
+
+def percentile(values, q):
+    # Nearest-rank percentile of a non-empty list
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+def print_call_summary(calls, metrics_path):
+    if not calls:
+        return
+    print(f"\n{len(calls)} API calls (see {metrics_path}):")
+    print(f"  {'':<14}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}{'total':>12}")
+    columns = [
+        ("input", "input_tokens", "{:.0f}"),
+        ("cache write", "cache_creation_input_tokens", "{:.0f}"),
+        ("cache read", "cache_read_input_tokens", "{:.0f}"),
+        ("output", "output_tokens", "{:.0f}"),
+        ("latency (s)", "latency", "{:.2f}"),
+        ("cost ($)", "cost", "{:.5f}"),
+    ]
+    for label, field, fmt in columns:
+        values = [call[field] for call in calls if call[field] is not None]
+        if not values:
+            continue
+        cells = [fmt.format(percentile(values, q)) for q in (50, 90, 99)] + [fmt.format(max(values))]
+        print(f"  {label:<14}" + "".join(f"{cell:>10}" for cell in cells) + f"{fmt.format(sum(values)):>12}")
+
+    prompt_tokens = sum(call["input_tokens"] + call["cache_creation_input_tokens"]
+                        + call["cache_read_input_tokens"] for call in calls)
+    if prompt_tokens:
+        cached = sum(call["cache_read_input_tokens"] for call in calls)
+        print(f"  {cached / prompt_tokens:.1%} of prompt tokens were read from the prompt cache")
+
+
+async def expand_jobs(jobs, engine, existing_instructions, output, log, total, cache=None, metrics=None,
+                      pack_tokens=0):
+    # With pack_tokens, jobs are sent in packed groups; a group whose answer
+    # doesn't parse is split in half and retried, down to single sections
+    stats = new_stats()
+
+    def report(job, outcome, added):
+        finish_outcome(outcome, stats, log)
+        print(f"({stats['done']}/{total}) {job['title']} - {job['heading']}{job['label']}: "
+              f"{outcome['status']}{' (cached)' if outcome.get('cached') else ''}, {added} pairs")
+
+    async def expand_job(job):
+        params = request_params(job)
+        outcome = new_outcome(job)
+        added = 0
+        hit = cache.get(params) if cache is not None else None
+        if hit is not None:
+            added = record_completion(job, params, hit["text"], hit["usage"], outcome, stats,
+                                      existing_instructions, output, cached=True)
+        else:
             try:
-                response = client.messages.create(
-                    model="claude-haiku-4-5-20251001",
-                    max_tokens=600,
-                    messages=[{"role": "user", "content": prompt}]
-                )
-
-                text = response.content[0].text.strip()
-                # Strip markdown code blocks if present
-                text = text.replace("```json", "").replace("```", "").strip()
-                generated = json.loads(text)
-
-                for item in generated:
-                    q = item.get("question", "").strip()
-                    a = item.get("answer", "").strip()
-                    if q and a and q not in existing_instructions:
-                        new_pairs.append({
-                            "instruction": q,
-                            "input": "",
-                            "output": a
-                        })
-                        existing_instructions.add(q)
-
-            except Exception as e:
-                print(f"  -> Error: {e}")
-                continue
+                response, attempts, latency = await engine.create(params)
+                outcome.update(attempts=attempts, latency=round(latency, 3))
+                text = response.content[0].text
+            except ExpansionError as e:
+                outcome.update(status="failed", attempts=e.attempts, error=str(e))
+            except (IndexError, AttributeError) as e:
+                outcome.update(status="parse_error", error=f"{type(e).__name__}: {e}")
+            else:
+                added = record_completion(job, params, text, response.usage, outcome, stats,
+                                          existing_instructions, output, cache, metrics=metrics)
+
+        report(job, outcome, added)
+
+    async def expand_group(group):
+        if len(group) == 1:
+            await expand_job(group[0])
+            return
+        params = packed_params(group)
+        keys = [job["key"] for job in group]
+        hit = cache.get(params) if cache is not None else None
+        if hit is not None:
+            text, usage, latency, attempts, cached = hit["text"], hit["usage"], None, None, True
+        else:
+            try:
+                response, attempts, latency = await engine.create(params)
+                text = response.content[0].text
+            except ExpansionError as e:
+                for job in group:
+                    outcome = new_outcome(job)
+                    outcome.update(status="failed", attempts=e.attempts, error=str(e), packed=len(group))
+                    report(job, outcome, 0)
+                return
+            except (IndexError, AttributeError):
+                text = ""
+            usage, cached = response.usage, False
+            latency = round(latency, 3)
+
+        cost = record_call(keys, params, usage, latency, stats, cached, metrics=metrics)
+        try:
+            sections = parse_packed(text, len(group))
+        except ValueError as e:
+            half = len(group) // 2
+            print(f"  -> packed answer for {len(group)} sections unusable ({e}), splitting")
+            await expand_group(group[:half])
+            await expand_group(group[half:])
+            return
+        if cache is not None and not cached:
+            cache.put(params, text, usage_dict(usage))
+
+        for job, generated in zip(group, sections):
+            added = add_pairs(generated, existing_instructions, output, job["key"])
+            stats["pairs"] += added
+            outcome = new_outcome(job)
+            outcome.update(status="ok", pairs=added, packed=len(group), cached=cached,
+                           cost=round(cost / len(group), 6))
+            if attempts is not None:
+                outcome.update(attempts=attempts, latency=latency)
+            report(job, outcome, added)
+
+    if pack_tokens:
+        await engine.map(expand_group, pack_jobs(jobs, pack_tokens))
+    else:
+        await engine.map(expand_job, jobs)
+    return stats
+
+
+def expand_pairs(input_jsonl, cleaned_json, output_jsonl, client=None, concurrency=CONCURRENCY,
+                 max_retries=5, log_path=LOG_PATH, cache_path=RESPONSE_CACHE_PATH, replay=False,
+                 metrics_path=METRICS_PATH, pack_tokens=0, near_threshold=NEAR_THRESHOLD):
+    # Load existing pairs so we don't duplicate
+    existing_instructions = load_existing_instructions(input_jsonl, near_threshold)
+
+    # Sections already expanded by an earlier run are skipped. Cleaned pages
+    # are streamed twice: once to count requests for the progress line, then
+    # for the requests themselves.
+    done = set() if replay else load_checkpoint(log_path)
+    registry = load_templates()
+
+    def pending_jobs():
+        return (job for job in iter_jobs(cleaned_json, registry) if job["key"] not in done)
+
+    total_requests = sum(1 for _ in pending_jobs())
+    if done:
+        print(f"Skipping {len(done)} requests already expanded (see {log_path}, or use --replay)")
+    if pack_tokens:
+        requests = sum(1 for _ in pack_jobs(pending_jobs(), pack_tokens))
+        print(f"{total_requests} sections packed into {requests} requests, {concurrency} at a time")
+    else:
+        print(f"{total_requests} requests to make, {concurrency} at a time")
+
+    if client is None:
+        # ExpansionEngine does the retrying; SDK retries would hide errors,
+        # attempts and latency from it
+        client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), max_retries=0)
+    cache = ResponseCache(cache_path) if cache_path else None
+
+    # New pairs are appended as each section finishes, so an interrupted run
+    # keeps what it already paid for. Every request's outcome is logged.
+    started = time.monotonic()
+    with JsonlAppender(output_jsonl) as output, JsonlAppender(log_path) as log, \
+            JsonlAppender(metrics_path) as metrics:
+        async def run():
+            engine = ExpansionEngine(client, concurrency, max_retries)
+            stats = await expand_jobs(pending_jobs(), engine, existing_instructions,
+                                      output, log, total_requests, cache, metrics, pack_tokens)
+            return stats, engine.retries
 
-            # Be polite to the API
-            time.sleep(0.5)
+        stats, retries = asyncio.run(run())
 
-    # Append new pairs to existing file
-    with open(output_jsonl, 'a', encoding='utf-8') as f:
-        for pair in new_pairs:
-            f.write(json.dumps(pair, ensure_ascii=False) + '\n')
+    print(f"\nGenerated {stats['pairs']} new pairs in {time.monotonic() - started:.0f}s.")
+    print(f"{stats['ok']} requests succeeded, {stats['failed']} failed, {retries} retries (see {log_path})")
+    print_near_duplicates(existing_instructions)
+    print_call_summary(stats["calls"], metrics_path)
+    print_costs(stats, cache)
+    if cache is not None:
+        cache.close()
+    print(f"Total pairs now in {output_jsonl}")
+    return stats
+
+
+# Message Batches mode: every job goes into one or more batch jobs (at half
+# the per-token price), whose ids are persisted so a later run can pick up
+# polling, read the results, or resubmit the requests that failed.
+BATCH_STATE_PATH = "data/training/expansion_batches.json"
+BATCH_LIMIT = 10000
+POLL_INTERVAL = 30
+MAX_POLL_INTERVAL = 600
+
+
+def load_batch_state(path):
+    # {"batches": [{"id", "custom_ids", "processed"}], "done": [...], "failed": {custom_id: error}}
+    if not os.path.exists(path):
+        return {"batches": [], "done": [], "failed": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_batch_state(state, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def submit_batches(client, jobs, state, state_path):
+    # section_key is already a valid custom_id (16 hex characters)
+    for start in range(0, len(jobs), BATCH_LIMIT):
+        group = jobs[start:start + BATCH_LIMIT]
+        batch = client.messages.batches.create(requests=[
+            {"custom_id": job["key"], "params": request_params(job)}
+            for job in group
+        ])
+        state["batches"].append({"id": batch.id, "custom_ids": [job["key"] for job in group], "processed": False})
+        for job in group:
+            state["failed"].pop(job["key"], None)
+        save_batch_state(state, state_path)
+        print(f"Submitted batch {batch.id} with {len(group)} requests")
+
+
+def wait_for_batch(client, batch_id, interval=POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+    # Polls until the batch has ended, backing off while it is still running
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        if batch.processing_status == "ended":
+            return batch
+        counts = batch.request_counts
+        print(f"  -> {batch_id}: {batch.processing_status}, {counts.processing} processing, "
+              f"{counts.succeeded} succeeded, {counts.errored} errored; next check in {interval:.0f}s")
+        time.sleep(interval)
+        interval = min(max_interval, interval * 1.5)
+
+
+def settle_batch_outcome(key, outcome, state, stats, log):
+    if outcome["status"] == "ok":
+        state["done"].append(key)
+    else:
+        state["failed"][key] = outcome["error"]
+    finish_outcome(outcome, stats, log)
+
+
+def read_batch_results(client, batch_id, jobs, existing_instructions, output, log, state, stats, cache=None,
+                       metrics=None):
+    # Results are streamed from the API; each is matched to its job by custom_id
+    for entry in client.messages.batches.results(batch_id):
+        key = entry.custom_id
+        job = jobs.get(key)
+        if job is None:
+            # The cleaned corpus changed since submission
+            outcome = {"key": key, "status": "failed", "error": "no matching section"}
+        else:
+            outcome = new_outcome(job)
+            result = entry.result
+            if result.type == "succeeded":
+                try:
+                    text = result.message.content[0].text
+                except (IndexError, AttributeError) as e:
+                    outcome.update(status="parse_error", error=f"{type(e).__name__}: {e}")
+                else:
+                    record_completion(job, request_params(job), text, result.message.usage, outcome, stats,
+                                      existing_instructions, output, cache, batch=True, metrics=metrics)
+            else:
+                error = getattr(result, "error", None)
+                outcome.update(status="failed", error=f"{result.type}: {error}" if error else result.type)
+        outcome["batch"] = batch_id
+        settle_batch_outcome(key, outcome, state, stats, log)
+
+
+def expand_pairs_batch(input_jsonl, cleaned_json, output_jsonl, client=None, state_path=BATCH_STATE_PATH,
+                       log_path=LOG_PATH, resubmit=False, poll_interval=POLL_INTERVAL,
+                       cache_path=RESPONSE_CACHE_PATH, replay=False, metrics_path=METRICS_PATH,
+                       near_threshold=NEAR_THRESHOLD):
+    existing_instructions = load_existing_instructions(input_jsonl, near_threshold)
+
+    if client is None:
+        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    cache = ResponseCache(cache_path) if cache_path else None
+
+    jobs = {job["key"]: job for job in iter_jobs(cleaned_json)}
+    state = load_batch_state(state_path)
+    done = set() if replay else set(state["done"]) | load_checkpoint(log_path)
+    pending = {key for batch in state["batches"] if not batch["processed"] for key in batch["custom_ids"]}
+
+    # New sections, plus failed ones when asked; everything else is either
+    # finished or still in a batch from an earlier run
+    to_submit = [
+        job for key, job in jobs.items()
+        if key not in done and key not in pending and (resubmit or key not in state["failed"])
+    ]
+    skipped = sum(1 for key in state["failed"] if key in jobs and key not in pending) if not resubmit else 0
+    print(f"{len(jobs)} requests: {len(done & jobs.keys())} done, {len(pending)} in open batches, "
+          f"{len(to_submit)} to submit" + (f", {skipped} failed (use --resubmit)" if skipped else ""))
+
+    stats = new_stats()
+    with JsonlAppender(output_jsonl) as output, JsonlAppender(log_path) as log, \
+            JsonlAppender(metrics_path) as metrics:
+        # Requests answered before are replayed from the cache instead of
+        # being submitted again
+        if cache is not None:
+            uncached = []
+            for job in to_submit:
+                params = request_params(job)
+                hit = cache.get(params)
+                if hit is None:
+                    uncached.append(job)
+                    continue
+                outcome = new_outcome(job)
+                record_completion(job, params, hit["text"], hit["usage"], outcome, stats,
+                                  existing_instructions, output, cached=True, batch=True)
+                settle_batch_outcome(job["key"], outcome, state, stats, log)
+            if len(uncached) < len(to_submit):
+                print(f"Replayed {len(to_submit) - len(uncached)} requests from the response cache")
+                save_batch_state(state, state_path)
+            to_submit = uncached
+        if to_submit:
+            submit_batches(client, to_submit, state, state_path)
+
+        for batch in state["batches"]:
+            if batch["processed"]:
+                continue
+            ended = wait_for_batch(client, batch["id"], poll_interval)
+            counts = ended.request_counts
+            print(f"Batch {batch['id']} ended: {counts.succeeded} succeeded, {counts.errored} errored, "
+                  f"{counts.expired} expired, {counts.canceled} canceled")
+            read_batch_results(client, batch["id"], jobs, existing_instructions, output, log, state, stats,
+                               cache, metrics)
+            batch["processed"] = True
+            save_batch_state(state, state_path)
 
-    print(f"\nGenerated {len(new_pairs)} new pairs.")
+    print(f"\nGenerated {stats['pairs']} new pairs.")
+    print(f"{stats['ok']} requests succeeded, {stats['failed']} failed (see {log_path})")
+    print_near_duplicates(existing_instructions)
+    print_call_summary(stats["calls"], metrics_path)
+    print_costs(stats, cache)
+    if cache is not None:
+        cache.close()
+    if state["failed"]:
+        print(f"{len(state['failed'])} requests can be retried with --batch --resubmit")
     print(f"Total pairs now in {output_jsonl}")
+    return stats
 
 
 if __name__ == "__main__":
-    expand_pairs(
-        "data/training/ff6_training_pairs.jsonl",
-        "data/cleaned/ff6_wiki_cleaned.json",
-        "data/training/ff6_training_pairs.jsonl"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Expand training pairs with Claude (costs money)")
+    parser.add_argument("--pairs", default="data/training/ff6_training_pairs.jsonl",
+                        help="existing pairs; new pairs are appended here too")
+    parser.add_argument("--cleaned", default="data/cleaned/ff6_wiki_cleaned.jsonl")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--log", default=LOG_PATH, help="per-request outcome log")
+    parser.add_argument("--metrics", default=METRICS_PATH, help="per-call token, latency and cost log")
+    parser.add_argument("--batch", action="store_true", help="use the Message Batches API (half price, async)")
+    parser.add_argument("--batch-state", default=BATCH_STATE_PATH, help="submitted batch ids and results")
+    parser.add_argument("--resubmit", action="store_true", help="with --batch, resubmit failed requests")
+    parser.add_argument("--cache", default=RESPONSE_CACHE_PATH, help="persistent response cache")
+    parser.add_argument("--no-cache", action="store_true", help="always call the API")
+    parser.add_argument("--pack", action="store_true",
+                        help="send several short sections per request (not with --batch)")
+    parser.add_argument("--pack-tokens", type=int, default=PACK_TOKENS, help="section text per packed request")
+    parser.add_argument("--near-threshold", type=float, default=NEAR_THRESHOLD,
+                        help="skip new questions this similar to an existing one (0: exact matches only)")
+    parser.add_argument("--replay", action="store_true",
+                        help="ignore the checkpoint and redo every section (cached responses are free)")
+    args = parser.parse_args()
+    cache_path = None if args.no_cache else args.cache
+    if args.batch and args.pack:
+        print("  -> --pack is ignored with --batch; batch requests are one section each")
+    if args.batch:
+        expand_pairs_batch(args.pairs, args.cleaned, args.pairs, state_path=args.batch_state,
+                           log_path=args.log, resubmit=args.resubmit, cache_path=cache_path, replay=args.replay,
+                           metrics_path=args.metrics, near_threshold=args.near_threshold)
+    else:
+        expand_pairs(args.pairs, args.cleaned, args.pairs, concurrency=args.concurrency,
+                     max_retries=args.max_retries, log_path=args.log, cache_path=cache_path, replay=args.replay,
+                     metrics_path=args.metrics, pack_tokens=args.pack_tokens if args.pack else 0,
+                     near_threshold=args.near_threshold)
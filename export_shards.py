@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+from chunking import ByteTokenizer, load_tokenizer
+from compact_dataset import iter_alpaca
+from record_io import iter_records
+
+# Alpaca prompt layout used for fine-tuning. Only the tokens after the prompt
+# (the response and EOS) should be trained on; prompt lengths are kept in the
+# index for the loss mask.
+PROMPT_TEMPLATE = "### Instruction:\n{instruction}\n\n### Response:\n"
+PROMPT_TEMPLATE_WITH_INPUT = "### Instruction:\n{instruction}\n\n### Input:\n{input}\n\n### Response:\n"
+
+SHARD_TOKENS = 50_000_000
+MAX_SEQ_LEN = 2048
+# ByteTokenizer yields about four ids per BPE token, and the pair generator
+# budgets answers in BPE-sized tokens, so byte sequences get four times the
+# room
+BYTE_MAX_SEQ_LEN = 4 * MAX_SEQ_LEN
+BUCKET_WIDTH = 64
+BATCH_SIZE = 8
+
+# index.npy columns
+SHARD, OFFSET, LENGTH, PROMPT_LENGTH = range(4)
+
+
+def encode_pair(pair, tokenizer):
+    template = PROMPT_TEMPLATE_WITH_INPUT if pair.get("input") else PROMPT_TEMPLATE
+    prompt = template.format(instruction=pair["instruction"], input=pair.get("input", ""))
+    prompt_ids = ([tokenizer.bos_id] if tokenizer.bos_id is not None else []) + tokenizer.encode(prompt)
+    return prompt_ids + tokenizer.encode(pair["output"]) + [tokenizer.eos_id], len(prompt_ids)
+
+
+def write_shards(pairs, tokenizer, output_dir, shard_tokens=SHARD_TOKENS):
+    # Tokenizes each pair once and appends its ids to the current shard file.
+    # An example never spans two shards. Returns the (n, 4) index and the
+    # shard file names.
+    dtype = np.uint16 if tokenizer.vocab_size <= np.iinfo(np.uint16).max else np.uint32
+    index = []
+    shards = []
+    f = None
+    offset = 0
+    try:
+        for pair in pairs:
+            ids, prompt_length = encode_pair(pair, tokenizer)
+            if f is None or (offset and offset + len(ids) > shard_tokens):
+                if f is not None:
+                    f.close()
+                shards.append(f"tokens_{len(shards):05d}.bin")
+                f = open(os.path.join(output_dir, shards[-1]), 'wb')
+                offset = 0
+            f.write(np.asarray(ids, dtype=dtype).tobytes())
+            index.append((len(shards) - 1, offset, len(ids), prompt_length))
+            offset += len(ids)
+    finally:
+        if f is not None:
+            f.close()
+    return np.asarray(index, dtype=np.int64).reshape(-1, 4), shards, np.dtype(dtype).name
+
+
+def length_buckets(lengths, width=BUCKET_WIDTH):
+    # Example ids sorted by length, plus the start of each width-sized
+    # length bucket within that order (bounds[i]:bounds[i + 1])
+    order = np.argsort(lengths, kind="stable")
+    bucket_ids = lengths[order] // width
+    bounds = np.flatnonzero(np.diff(bucket_ids)) + 1
+    return order, np.concatenate(([0], bounds, [len(order)]))
+
+
+def pack_examples(lengths, max_len=MAX_SEQ_LEN):
+    # Best-fit decreasing: longest examples first, each into the open pack
+    # with the least room that still fits it. Open packs are grouped by
+    # remaining room, so finding one is a scan over room sizes rather than
+    # over packs. Examples longer than max_len are left out.
+    by_room = [[] for _ in range(max_len + 1)]
+    packs = []
+    for example in np.argsort(-lengths, kind="stable"):
+        length = int(lengths[example])
+        if length > max_len:
+            continue
+        room = length
+        while room <= max_len and not by_room[room]:
+            room += 1
+        if room > max_len:
+            packs.append([int(example)])
+            pack = len(packs) - 1
+            left = max_len - length
+        else:
+            pack = by_room[room].pop()
+            packs[pack].append(int(example))
+            left = room - length
+        if left:
+            by_room[left].append(pack)
+    return packs
+
+
+def packs_to_arrays(packs, lengths):
+    # CSR layout: pack p holds items[ptr[p]:ptr[p + 1]], and starts gives each
+    # item's token offset inside its pack. Attention and position ids reset
+    # at every start, so packed examples never attend to each other.
+    ptr = np.zeros(len(packs) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([len(p) for p in packs])
+    items = np.asarray([i for p in packs for i in p], dtype=np.int64)
+    starts = np.zeros(len(items), dtype=np.int64)
+    if len(items):
+        item_lengths = lengths[items]
+        csum = np.cumsum(item_lengths) - item_lengths
+        starts = csum - np.repeat(csum[ptr[:-1]], np.diff(ptr))
+    return ptr, items, starts
+
+
+def padded_tokens(lengths, batch_size):
+    # Tokens computed when consecutive batches are padded to their longest example
+    if not len(lengths):
+        return 0
+    n_batches = -(-len(lengths) // batch_size)
+    padded = np.zeros(n_batches * batch_size, dtype=np.int64)
+    padded[:len(lengths)] = lengths
+    batch_max = padded.reshape(n_batches, batch_size).max(axis=1)
+    counts = np.full(n_batches, batch_size)
+    counts[-1] = len(lengths) - (n_batches - 1) * batch_size
+    return int((batch_max * counts).sum())
+
+
+def bucketed_tokens(lengths, order, bounds, batch_size):
+    # Same, with batches drawn from within one length bucket at a time
+    return sum(padded_tokens(lengths[order[start:end]], batch_size)
+               for start, end in zip(bounds[:-1], bounds[1:]))
+
+
+class TokenShards:
+    # Read side: memory-maps the shards and returns (ids, prompt_length) per
+    # example without loading the dataset
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.index = np.load(os.path.join(directory, "index.npy"), mmap_mode="r")
+        self.shards = [np.memmap(os.path.join(directory, name), dtype=self.meta["dtype"], mode="r")
+                       for name in self.meta["shards"]]
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, i):
+        shard, offset, length, prompt_length = self.index[i]
+        return self.shards[shard][offset:offset + length], int(prompt_length)
+
+
+def export_shards(input_path, output_dir, tokenizer_spec="bytes", max_seq_len=None,
+                  batch_size=BATCH_SIZE, bucket_width=BUCKET_WIDTH, shard_tokens=SHARD_TOKENS):
+    # Shards in the wrong vocabulary are useless for training, so a tokenizer
+    # that can't be loaded is an error rather than a fallback to bytes
+    tokenizer = load_tokenizer(tokenizer_spec)
+    if tokenizer is None:
+        raise ValueError(f"Tokenizer {tokenizer_spec!r} could not be loaded; "
+                         f"install it, or pass --tokenizer bytes for byte-level ids")
+    if max_seq_len is None:
+        max_seq_len = BYTE_MAX_SEQ_LEN if isinstance(tokenizer, ByteTokenizer) else MAX_SEQ_LEN
+    if isinstance(tokenizer, ByteTokenizer):
+        print("  -> Byte-level ids; pass --tokenizer for the model's own vocabulary")
+
+    # A directory is a compact_dataset store, anything else Alpaca records
+    pairs = iter_alpaca(input_path) if os.path.isdir(input_path) else iter_records(input_path)
+
+    os.makedirs(output_dir, exist_ok=True)
+    index, shards, dtype = write_shards(pairs, tokenizer, output_dir, shard_tokens)
+    np.save(os.path.join(output_dir, "index.npy"), index)
+    lengths = index[:, LENGTH]
+
+    order, bounds = length_buckets(lengths, bucket_width)
+    np.savez(os.path.join(output_dir, "buckets.npz"), order=order, bounds=bounds, width=bucket_width)
+
+    packs = pack_examples(lengths, max_seq_len)
+    ptr, items, starts = packs_to_arrays(packs, lengths)
+    np.savez(os.path.join(output_dir, "packs.npz"), ptr=ptr, items=items, starts=starts, max_len=max_seq_len)
+
+    too_long = int((lengths > max_seq_len).sum())
+    meta = {
+        "tokenizer": tokenizer.name,
+        "vocab_size": tokenizer.vocab_size,
+        "bos_id": tokenizer.bos_id,
+        "eos_id": tokenizer.eos_id,
+        "pad_id": tokenizer.pad_id,
+        "dtype": dtype,
+        "prompt_template": PROMPT_TEMPLATE,
+        "prompt_template_with_input": PROMPT_TEMPLATE_WITH_INPUT,
+        "shards": shards,
+        "examples": len(index),
+        "tokens": int(lengths.sum()),
+        "max_seq_len": max_seq_len,
+        "too_long": too_long,
+    }
+    with open(os.path.join(output_dir, "meta.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Tokenized {len(index)} pairs ({meta['tokens']} tokens) into {len(shards)} shard(s) in {output_dir}")
+    if not len(index):
+        return meta
+    print(f"Lengths: mean {lengths.mean():.0f}, p50 {np.percentile(lengths, 50):.0f}, "
+          f"p95 {np.percentile(lengths, 95):.0f}, max {lengths.max()}")
+    if too_long:
+        print(f"  -> {too_long} pairs longer than {max_seq_len} tokens are left out of the packs")
+
+    real = lengths.sum()
+    packed = lengths[lengths <= max_seq_len].sum()
+    print(f"\nPadding efficiency (real tokens / tokens computed), batch size {batch_size}:")
+    print(f"  unsorted batches: {real / padded_tokens(lengths, batch_size):.1%}")
+    print(f"  length buckets:   {real / bucketed_tokens(lengths, order, bounds, batch_size):.1%}"
+          f" ({len(bounds) - 1} buckets of width {bucket_width})")
+    if packs:
+        print(f"  packed:           {packed / (len(packs) * max_seq_len):.1%}"
+              f" ({len(packs)} sequences of {max_seq_len})")
+    return meta
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tokenize training pairs into packed NumPy shards")
+    parser.add_argument("--input", default="data/training/ff6_training_pairs_grounded.jsonl",
+                        help="Alpaca .jsonl (default: grounding_filter.py output), or a compact_dataset directory")
+    parser.add_argument("--output", default="data/training/shards")
+    parser.add_argument("--tokenizer", default="bytes",
+                        help='"tiktoken:<encoding>", "bytes", or a local Hugging Face tokenizer')
+    parser.add_argument("--max-seq-len", type=int,
+                        help=f"default {MAX_SEQ_LEN}, or {BYTE_MAX_SEQ_LEN} with --tokenizer bytes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="for the padding report")
+    parser.add_argument("--bucket-width", type=int, default=BUCKET_WIDTH)
+    parser.add_argument("--shard-tokens", type=int, default=SHARD_TOKENS)
+    args = parser.parse_args()
+    export_shards(args.input, args.output, args.tokenizer, args.max_seq_len,
+                  args.batch_size, args.bucket_width, args.shard_tokens)
@@ -0,0 +1,193 @@
+import argparse
+import time
+
+import numpy as np
+
+from expansion_jobs import iter_jobs
+from names import name_words, words
+from record_io import iter_records, write_records
+
+THRESHOLD = 0.5
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at", "by", "for", "with", "from",
+    "as", "into", "onto", "about", "after", "before", "during", "while", "when", "where", "which", "who",
+    "whom", "what", "how", "why", "that", "this", "these", "those", "it", "its", "is", "are", "was",
+    "were", "be", "been", "being", "has", "have", "had", "do", "does", "did", "can", "could", "will",
+    "would", "should", "may", "might", "must", "not", "no", "so", "than", "then", "there", "their",
+    "they", "them", "he", "she", "his", "her", "you", "your", "i", "we", "our", "also", "only", "very",
+    "more", "most", "such", "any", "all", "each", "both", "some", "other", "up", "out", "over", "just",
+    "s", "t",
+}
+
+
+class Vocabulary:
+    # Word ids shared by answers and sections, so overlap checks are
+    # integer comparisons
+    def __init__(self):
+        self.ids = {}
+
+    def word_ids(self, text):
+        ids = self.ids
+        return [ids.setdefault(word, len(ids)) for word in words(text)]
+
+    def name_ids(self, text):
+        # Names as the near-duplicate index reads them (see names.py)
+        ids = self.ids
+        return [ids.setdefault(word, len(ids)) for word in name_words(text)]
+
+    def word_flags(self):
+        # Per word id: stopword, number
+        vocab = sorted(self.ids, key=self.ids.get)
+        stop = np.fromiter((w in STOPWORDS for w in vocab), dtype=bool, count=len(vocab))
+        number = np.fromiter((w.isdigit() for w in vocab), dtype=bool, count=len(vocab))
+        return vocab, stop, number
+
+
+def flatten(token_lists):
+    # Concatenated ids plus the owning text of each token
+    lengths = np.fromiter((len(t) for t in token_lists), dtype=np.int64, count=len(token_lists))
+    flat = np.fromiter((i for t in token_lists for i in t), dtype=np.int64, count=int(lengths.sum()))
+    return flat, np.repeat(np.arange(len(token_lists)), lengths)
+
+
+def bigrams(ids, owner, vocab_size):
+    # Codes of adjacent word pairs that stay inside one text
+    same = owner[1:] == owner[:-1]
+    return (ids[:-1] * vocab_size + ids[1:])[same], owner[:-1][same]
+
+
+def coverage(hits, owner, count, mask=None):
+    # Fraction of each text's (masked) tokens that hit; 0 for none
+    if mask is not None:
+        hits, owner = hits[mask], owner[mask]
+    total = np.bincount(owner, minlength=count)
+    found = np.bincount(owner, weights=hits, minlength=count)
+    return np.divide(found, total, out=np.zeros(count), where=total > 0)
+
+
+def score_answers(answers, sources, answer_source):
+    # Scores every answer against its source section in one pass. Each token
+    # becomes the key (source index, word or bigram code), and np.isin
+    # against the keys of all sections answers "does this answer's source
+    # contain it" for every token at once. Returns per answer: unigram and
+    # bigram support, count of unsupported numbers and names, and the
+    # unsupported words themselves for the answers that have any.
+    vocab = Vocabulary()
+    a_ids, a_owner = flatten([vocab.word_ids(text) for text in answers])
+    n_ids, n_owner = flatten([vocab.name_ids(text) for text in answers])
+    s_ids, s_owner = flatten([vocab.word_ids(text) for text in sources])
+    vocab_words, stop, number = vocab.word_flags()
+    size = max(1, len(vocab_words))
+
+    answer_source = np.asarray(answer_source, dtype=np.int64)
+    a_src = answer_source[a_owner]
+
+    # Unigrams: content words of the answer found in its section
+    source_keys = np.unique(s_owner * size + s_ids)
+    hits = np.isin(a_src * size + a_ids, source_keys)
+    content = ~stop[a_ids]
+    unigram = coverage(hits, a_owner, len(answers), content)
+
+    # Bigrams, with codes compacted so keys stay within int64
+    s_codes, s_code_owner = bigrams(s_ids, s_owner, size)
+    a_codes, a_code_owner = bigrams(a_ids, a_owner, size)
+    codes, inverse = np.unique(np.concatenate((s_codes, a_codes)), return_inverse=True)
+    span = max(1, len(codes))
+    bigram_keys = np.unique(s_code_owner * span + inverse[:len(s_codes)])
+    bigram_hits = np.isin(answer_source[a_code_owner] * span + inverse[len(s_codes):], bigram_keys)
+    bigram = coverage(bigram_hits, a_code_owner, len(answers))
+
+    # Numbers and mid-sentence capitalized words must appear in the section
+    missing_number = number[a_ids] & ~hits
+    name_hits = np.isin(answer_source[n_owner] * size + n_ids, source_keys)
+    missing_name = ~name_hits
+    numbers = np.bincount(a_owner[missing_number], minlength=len(answers))
+    names = np.bincount(n_owner[missing_name], minlength=len(answers))
+
+    unsupported = {}
+    for owner, ids, missing in ((a_owner, a_ids, missing_number), (n_owner, n_ids, missing_name)):
+        for position in np.flatnonzero(missing):
+            words_missing = unsupported.setdefault(int(owner[position]), [])
+            if vocab_words[ids[position]] not in words_missing:
+                words_missing.append(vocab_words[ids[position]])
+    return unigram, bigram, numbers, names, unsupported
+
+
+def load_sources(cleaned_json, keys):
+    # Section text for each expansion source key that is still in the corpus
+    sources = {}
+    for job in iter_jobs(cleaned_json):
+        if job["key"] in keys:
+            sources[job["key"]] = job["chunk"]
+    return sources
+
+
+def filter_pairs(pairs_path, cleaned_json, output_path, threshold=THRESHOLD, drop=False, show=5):
+    started = time.monotonic()
+    answers = []
+    answer_keys = []
+    for pair in iter_records(pairs_path):
+        if pair.get("source"):
+            answers.append(pair["output"])
+            answer_keys.append(pair["source"])
+    sources = load_sources(cleaned_json, set(answer_keys))
+    source_keys = list(sources)
+    source_index = {key: i for i, key in enumerate(source_keys)}
+
+    # Answers whose section is gone from the corpus can't be checked
+    checkable = [i for i, key in enumerate(answer_keys) if key in source_index]
+    unigram, bigram, numbers, names, unsupported = score_answers(
+        [answers[i] for i in checkable],
+        [sources[key] for key in source_keys],
+        [source_index[answer_keys[i]] for i in checkable])
+    score = (unigram + bigram) / 2
+    failed = (score < threshold) | (numbers > 0) | (names > 0)
+    scored = time.monotonic() - started
+
+    # Second pass over the pairs to tag or drop, in their original order
+    results = {}
+    for row, i in enumerate(checkable):
+        results[i] = {"score": round(float(score[row]), 3), "unsupported": unsupported.get(row, []),
+                      "passed": not bool(failed[row])}
+
+    def tagged_pairs():
+        answer = 0
+        for pair in iter_records(pairs_path):
+            if pair.get("source"):
+                result = results.get(answer)
+                answer += 1
+                if result is not None:
+                    if drop and not result["passed"]:
+                        continue
+                    pair["grounding"] = result
+            yield pair
+
+    count = write_records(output_path, tagged_pairs())
+
+    print(f"Scored {len(checkable)} generated answers against {len(sources)} sections in {scored:.1f}s")
+    if len(answers) > len(checkable):
+        print(f"  -> {len(answers) - len(checkable)} answers have no matching section in {cleaned_json}")
+    if len(checkable):
+        print(f"Score: p10 {np.percentile(score, 10):.2f}, p50 {np.percentile(score, 50):.2f}, "
+              f"p90 {np.percentile(score, 90):.2f}")
+        print(f"{int(failed.sum())} failed: {int((score < threshold).sum())} below {threshold}, "
+              f"{int((numbers > 0).sum())} with unsupported numbers, {int((names > 0).sum())} with unsupported names")
+        for row in np.flatnonzero(failed)[:show]:
+            preview = answers[checkable[row]][:80].replace("\n", " ")
+            print(f"  {score[row]:.2f}  {unsupported.get(int(row), [])}  {preview}")
+    print(f"{'Dropped failing pairs' if drop else 'Tagged pairs'}; wrote {count} pairs to {output_path}")
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check generated answers against their source sections")
+    parser.add_argument("--pairs", default="data/training/ff6_training_pairs_dedup.jsonl",
+                        help="near_dedup.py output")
+    parser.add_argument("--cleaned", default="data/cleaned/ff6_wiki_cleaned.jsonl")
+    parser.add_argument("--output", default="data/training/ff6_training_pairs_grounded.jsonl")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="minimum overlap score")
+    parser.add_argument("--drop", action="store_true", help="drop failing pairs instead of tagging them")
+    parser.add_argument("--show", type=int, default=5, help="examples of failing answers to print")
+    args = parser.parse_args()
+    filter_pairs(args.pairs, args.cleaned, args.output, args.threshold, args.drop, args.show)
@@ -0,0 +1,33 @@
+import re
+
+# Words are runs of letters or of digits, so numbers glued to letters
+# ("x99", "1200hp") still count as numbers
+WORD_RE = re.compile(r"[a-z]+|[0-9]+")
+# A capitalized word, and whether it starts a sentence (so its capital says
+# nothing about it being a name)
+NAME_RE = re.compile(r"(?:(^|[.!?:\n])\s*)?\b([A-Z][A-Za-z0-9]*)")
+
+# Capitalized words that aren't names of anything in the game: the game's
+# own title, and function words that take a capital in titles or headings
+NOT_NAMES = {
+    "final", "fantasy", "vi", "ff", "ffvi", "i",
+    "a", "an", "the", "and", "or", "but", "if", "as", "of", "to", "in", "on", "at", "by", "for", "with",
+    "from", "is", "are", "was", "be", "do", "does", "did", "can", "will", "not", "no", "so", "then",
+    "what", "when", "where", "which", "who", "how", "why", "this", "that", "these", "those",
+    "it", "its", "he", "she", "his", "her", "they", "their", "you", "your", "we", "our", "my",
+}
+
+
+def words(text):
+    # Lowercased words of the text
+    return WORD_RE.findall(text.lower())
+
+
+def name_words(text):
+    # Lowercased words the text writes with a capital somewhere other than
+    # the start of a sentence. Digit runs are left to the number checks.
+    found = []
+    for m in NAME_RE.finditer(text):
+        if m.group(1) is None:
+            found.extend(w for w in words(m.group(2)) if w not in NOT_NAMES and not w.isdigit())
+    return found
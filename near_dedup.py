@@ -0,0 +1,279 @@
+import argparse
+import hashlib
+import re
+
+import numpy as np
+
+from names import name_words, words
+from record_io import iter_records, write_records
+
+THRESHOLD = 0.7
+NUM_PERM = 128
+SHINGLE_SIZE = 3
+BATCH_SIZE = 2048
+
+NON_WORD_RE = re.compile(r'[^a-z0-9]+')
+
+# Words that change the phrasing of a question but not what it asks
+STOPWORDS = {"a", "an", "the", "do", "does", "did", "can", "could", "i", "you", "we", "my", "in", "of",
+             "final", "fantasy", "vi", "ff6"}
+SYNONYMS = {
+    "obtain": "get", "acquire": "get", "receive": "get", "earn": "get",
+    "locate": "find", "located": "find",
+    "whats": "what", "wheres": "where", "hows": "how",
+    "used": "use", "using": "use", "uses": "use",
+}
+
+
+def normalize(text):
+    tokens = NON_WORD_RE.sub(" ", text.lower().replace("'", "")).split()
+    return " ".join(SYNONYMS.get(w, w) for w in tokens if w not in STOPWORDS)
+
+
+def fold(text):
+    return " ".join(text.casefold().split())
+
+
+def collect_names(texts, names=None):
+    # Adds the names in the texts (see names.name_words) to `names`
+    names = set() if names is None else names
+    for text in texts:
+        names.update(name_words(text))
+    return names
+
+
+def entity_key(text, names):
+    # Questions built from the same template differ only in the name they
+    # ask about, which leaves them lexically close. Near-duplicates must
+    # also mention the same names and numbers. Names are looked up in
+    # `names` (from collect_names), so "terra" and "Terra" count the same.
+    found = sorted({w for w in words(text) if w in names or w.isdigit()})
+    digest = hashlib.blake2b("\0".join(found).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+def shingle_hashes(texts, size=SHINGLE_SIZE):
+    # Character n-gram hashes of every normalized text in one pass: the texts
+    # are joined, a rolling polynomial hash is taken at every offset, and
+    # n-grams that cross into the next text are dropped. Returns (hashes,
+    # doc) where doc[i] is the text hashes[i] came from; texts shorter than
+    # `size` hash as a whole so every text has at least one shingle.
+    encoded = [normalize(t).encode("utf-8") for t in texts]
+    encoded = [e if len(e) >= size else e.ljust(size, b"\0") for e in encoded]
+    lengths = np.fromiter((len(e) for e in encoded), dtype=np.int64, count=len(encoded))
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint64)
+
+    positions = len(data) - size + 1
+    hashes = np.zeros(positions, dtype=np.uint64)
+    for k in range(size):
+        hashes = hashes * np.uint64(257) + data[k:k + positions]
+
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    doc = np.repeat(np.arange(len(encoded)), lengths)[:positions]
+    valid = np.arange(positions) + size <= (starts + lengths)[doc]
+    return hashes[valid], doc[valid]
+
+
+class MinHasher:
+    # MinHash signatures under `num_perm` multiply-add-shift hash functions.
+    # The fraction of equal entries in two signatures estimates the Jaccard
+    # similarity of the two shingle sets.
+    def __init__(self, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+    def signatures(self, texts):
+        texts = list(texts)
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(texts), BATCH_SIZE):
+            batch = texts[start:start + BATCH_SIZE]
+            hashes, doc = shingle_hashes(batch, self.shingle_size)
+            # (num_perm, shingles); uint64 arithmetic wraps, which is what
+            # the hash family wants
+            with np.errstate(over="ignore"):
+                permuted = self.a[:, None] * hashes + self.b[:, None]
+            permuted >>= np.uint64(32)
+            # doc is sorted, so each text's shingles are one contiguous run
+            bounds = np.flatnonzero(np.r_[True, doc[1:] != doc[:-1]])
+            out[start:start + len(batch)] = np.minimum.reduceat(permuted, bounds, axis=1).T
+        return out
+
+
+def lsh_params(threshold, num_perm):
+    # Bands x rows whose S-curve midpoint, (1/bands)^(1/rows), is closest to
+    # the threshold. Candidates are then checked against the threshold.
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class NearDuplicateIndex:
+    # Incremental LSH index over MinHash signatures. Each band of a signature
+    # is a bucket key; texts sharing a bucket are candidates, and a candidate
+    # is a duplicate when its estimated similarity reaches `threshold` and it
+    # has the same entity_key. `names` seeds the entity vocabulary; names
+    # capitalized in indexed texts are added to it.
+    def __init__(self, threshold=THRESHOLD, num_perm=NUM_PERM, shingle_size=SHINGLE_SIZE, seed=1, names=()):
+        self.threshold = threshold
+        self.names = set(names)
+        self.hasher = MinHasher(num_perm, shingle_size, seed)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self.tables = [{} for _ in range(self.bands)]
+        self.band_mult = np.random.default_rng(seed + 1).integers(1, 2 ** 63, self.rows, dtype=np.uint64)
+        self.signatures = np.empty((1024, num_perm), dtype=np.uint32)
+        self.entities = np.empty(1024, dtype=np.int64)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def band_keys(self, signatures, entities):
+        # One int per band per signature: the band's rows hashed together
+        # with the entity key, so texts about different names never share a
+        # bucket
+        n = len(signatures)
+        bands = signatures[:, :self.bands * self.rows].reshape(n, self.bands, self.rows).astype(np.uint64)
+        with np.errstate(over="ignore"):
+            keys = (bands * self.band_mult).sum(axis=2) ^ np.asarray(entities, dtype=np.int64).view(np.uint64)[:, None]
+        return keys.tolist()
+
+    def query_signature(self, signature, entity, keys):
+        # (id, similarity) of the closest indexed text at or over the
+        # threshold, or None
+        candidates = set()
+        for table, key in zip(self.tables, keys):
+            candidates.update(table.get(key, ()))
+        if not candidates:
+            return None
+        ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        ids = ids[self.entities[ids] == entity]
+        if not len(ids):
+            return None
+        similarity = (self.signatures[ids] == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        if similarity[best] < self.threshold:
+            return None
+        return int(ids[best]), float(similarity[best])
+
+    def add_signature(self, signature, entity, keys):
+        if self.size == len(self.signatures):
+            self.signatures = np.concatenate((self.signatures, np.empty_like(self.signatures)))
+            self.entities = np.concatenate((self.entities, np.empty_like(self.entities)))
+        self.signatures[self.size] = signature
+        self.entities[self.size] = entity
+        for table, key in zip(self.tables, keys):
+            table.setdefault(key, []).append(self.size)
+        self.size += 1
+        return self.size - 1
+
+    def prepare(self, texts, learn=False):
+        # (signature, entity, band keys) per text, computed in bulk. Texts
+        # being indexed (`learn`) add their names to the vocabulary first.
+        if learn:
+            collect_names(texts, self.names)
+        signatures = self.hasher.signatures(texts)
+        entities = [entity_key(text, self.names) for text in texts]
+        return zip(signatures, entities, self.band_keys(signatures, entities))
+
+    def query(self, text):
+        return self.query_signature(*next(iter(self.prepare([text]))))
+
+    def add(self, text):
+        return self.add_signature(*next(iter(self.prepare([text], learn=True))))
+
+    def dedup(self, texts):
+        # Adds every text that isn't a near-duplicate of an earlier one.
+        # Returns a match per text: None if it was kept, else (id, similarity)
+        # of the text it duplicates. Signatures are computed in batches.
+        texts = list(texts)
+        matches = []
+        for start in range(0, len(texts), BATCH_SIZE):
+            for prepared in self.prepare(texts[start:start + BATCH_SIZE], learn=True):
+                match = self.query_signature(*prepared)
+                if match is None:
+                    self.add_signature(*prepared)
+                matches.append(match)
+        return matches
+
+
+class QuestionSet:
+    # Set-like view for expansion_script: `q in questions` is true for exact
+    # (ignoring case) and near-duplicate questions, and add() indexes a new
+    # one
+    def __init__(self, questions=(), threshold=THRESHOLD, names=()):
+        questions = list(dict.fromkeys(questions))
+        self.exact = {fold(q) for q in questions}
+        self.index = NearDuplicateIndex(threshold, names=names)
+        self.index.dedup(questions)
+        self.near_duplicates = 0
+
+    def __len__(self):
+        return len(self.exact)
+
+    def __contains__(self, question):
+        if fold(question) in self.exact:
+            return True
+        if self.index.query(question) is not None:
+            self.near_duplicates += 1
+            return True
+        return False
+
+    def add(self, question):
+        self.exact.add(fold(question))
+        self.index.add(question)
+
+
+def dedup_pairs(input_path, output_path, threshold=THRESHOLD, field="instruction", show=10):
+    # Streams the pairs in batches, keeping the first of each group of
+    # near-duplicate questions. A first pass collects the names used across
+    # questions and answers, so a name counts however a question spells it.
+    names = collect_names(text for pair in iter_records(input_path)
+                          for text in (pair[field], pair.get("output", "")))
+    index = NearDuplicateIndex(threshold, names=names)
+    kept = []
+    removed = []
+
+    def filter_batch(batch):
+        texts = [pair[field] for pair in batch]
+        for pair, text, match in zip(batch, texts, index.dedup(texts)):
+            if match is None:
+                kept.append(text)
+                yield pair
+            else:
+                removed.append((text, kept[match[0]], match[1]))
+
+    def kept_pairs():
+        batch = []
+        for pair in iter_records(input_path):
+            batch.append(pair)
+            if len(batch) == BATCH_SIZE:
+                yield from filter_batch(batch)
+                batch = []
+        yield from filter_batch(batch)
+
+    count = write_records(output_path, kept_pairs())
+    print(f"Kept {count} of {count + len(removed)} pairs; {len(removed)} near-duplicate questions "
+          f"(similarity >= {threshold}) removed")
+    for text, original, similarity in removed[:show]:
+        print(f"  {similarity:.2f}  {text!r}  ~  {original!r}")
+    return count, len(removed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop pairs whose question nearly repeats an earlier one")
+    parser.add_argument("--input", default="data/training/ff6_training_pairs.jsonl")
+    parser.add_argument("--output", default="data/training/ff6_training_pairs_dedup.jsonl")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="estimated Jaccard similarity")
+    parser.add_argument("--field", default="instruction")
+    parser.add_argument("--show", type=int, default=10, help="examples of removed questions to print")
+    args = parser.parse_args()
+    dedup_pairs(args.input, args.output, args.threshold, args.field, args.show)
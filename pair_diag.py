@@ -1,23 +1,25 @@
-import json
+import sys
+from collections import Counter
+
+from record_io import iter_records
 
-with open("data/cleaned/ff6_wiki_cleaned.json", "r", encoding="utf-8") as f:
-    data = json.load(f)
+# Reads the cleaned .json array or a .jsonl stream without loading it all at once
+path = sys.argv[1] if len(sys.argv) > 1 else "data/cleaned/ff6_wiki_cleaned.jsonl"
 
+total_pages = 0
 total_sections = 0
-for page in data:
+headings = Counter()
+for page in iter_records(path):
+    total_pages += 1
     total_sections += len(page["sections"])
+    for section in page["sections"]:
+        headings[section["heading"].lower()] += 1
 
-print(f"Total pages: {len(data)}")
+print(f"Total pages: {total_pages}")
 print(f"Total sections: {total_sections}")
-print(f"Average sections per page: {total_sections / len(data):.1f}")
+print(f"Average sections per page: {total_sections / total_pages:.1f}")
 
 # Show section heading breakdown
-from collections import Counter
-headings = Counter()
-for page in data:
-    for section in page["sections"]:
-        headings[section["heading"].lower()] += 1
-
 print("\nTop 20 section headings:")
 for heading, count in headings.most_common(20):
     print(f"  {heading}: {count}")
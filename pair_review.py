@@ -92,4 +92,4 @@ def review_pairs(jsonl_path):
 
 
 if __name__ == "__main__":
-    review_pairs("data/training/ff6_training_pairs.jsonl")
\ No newline at end of file
+    review_pairs("data/training/ff6_training_pairs_grounded.jsonl")
\ No newline at end of file
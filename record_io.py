@@ -0,0 +1,159 @@
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Records are written compactly, one per line; orjson is used for both
+# directions when it is installed and produces the same layout.
+if orjson is not None:
+    def loads(data):
+        return orjson.loads(data)
+
+    def dumps(record):
+        return orjson.dumps(record).decode("utf-8")
+else:
+    def loads(data):
+        return json.loads(data)
+
+    def dumps(record):
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    # Yields the elements of a top-level JSON array from an open text file
+    # without reading the whole file. Each element is decoded with raw_decode
+    # as soon as it is complete in the buffer; the buffer only ever holds the
+    # unparsed tail plus the next chunk.
+    decoder = json.JSONDecoder()
+    buf = f.read(chunk_size)
+    eof = not buf
+    pos = len(buf) - len(buf.lstrip())
+    if buf[pos:pos + 1] != "[":
+        raise ValueError("expected a JSON array")
+    pos += 1
+
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        if pos < len(buf):
+            try:
+                record, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            else:
+                # A value touching the end of the buffer may continue in the next chunk
+                if end < len(buf) or eof:
+                    yield record
+                    pos = end
+                    continue
+        elif eof:
+            raise ValueError("unterminated JSON array")
+
+        more = f.read(max(chunk_size, len(buf) - pos))
+        eof = not more
+        buf = buf[pos:] + more
+        pos = 0
+
+
+def iter_records(path):
+    # Yields records one at a time from a .jsonl file, or from a plain JSON array.
+    if not path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            yield from iter_json_array(f)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if not line.endswith("\n"):
+                # Last record of an interrupted write; resume rewrites it
+                try:
+                    record = loads(line)
+                except ValueError:
+                    print(f"  -> Ignoring incomplete last record in {path}")
+                    return
+                yield record
+                return
+            yield loads(line)
+
+
+def write_records(path, records):
+    # Writes records as they are produced: one per line for .jsonl, otherwise
+    # as a JSON array with one record per line. The file is built under a
+    # temporary name and only replaces `path` once complete. Returns the count.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    jsonl = path.endswith(".jsonl")
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if not jsonl:
+            f.write("[")
+        for record in records:
+            if jsonl:
+                f.write(dumps(record) + "\n")
+            else:
+                f.write(("\n" if count == 0 else ",\n") + dumps(record))
+            count += 1
+        if not jsonl:
+            f.write("\n]\n")
+    os.replace(tmp_path, path)
+    return count
+
+
+def truncate_partial_record(path):
+    # Drops a trailing half-written line so appends start on a clean boundary
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        pos = size - 1
+        while pos > 0:
+            step = min(4096, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline != -1:
+                f.truncate(pos + newline + 1)
+                return
+        f.truncate(0)
+
+
+class JsonlAppender:
+    # Appends one JSON record per line and fsyncs on checkpoint(), so a crash
+    # loses at most the records written since the last checkpoint.
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        truncate_partial_record(path)
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record):
+        self.file.write(dumps(record) + "\n")
+
+    def checkpoint(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.checkpoint()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
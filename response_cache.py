@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+
+def request_key(params):
+    # Model, prompt and every sampling parameter, in a canonical encoding
+    canonical = json.dumps(params, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    # Persistent Messages API completions for expansion_script, keyed by
+    # request_key(params). Only responses that parsed are stored, so a bad
+    # completion is paid for again rather than replayed forever.
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                text TEXT NOT NULL,
+                usage TEXT NOT NULL,
+                created REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, params):
+        # {"text", "usage"} or None
+        row = self.conn.execute("SELECT text, usage FROM responses WHERE key = ?",
+                                (request_key(params),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return {"text": row[0], "usage": json.loads(row[1])}
+
+    def put(self, params, text, usage):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, model, text, usage, created) VALUES (?, ?, ?, ?, ?)",
+            (request_key(params), params.get("model", ""), text, json.dumps(usage), time.time()))
+        # Committed per response: each one was paid for
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
@@ -0,0 +1,87 @@
+import json
+import os
+import sqlite3
+import time
+from collections import Counter
+
+
+class SectionCache:
+    # Persistent cleaned-section store for data_cleaner. Keys are content
+    # hashes, so an entry is only ever reused for byte-identical input under
+    # the same cleaning rules. Least recently used entries are evicted once
+    # the stored text exceeds `max_mb`.
+    def __init__(self, path, max_mb=256):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sections (
+                key TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                counts TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                used REAL NOT NULL,
+                subheadings TEXT NOT NULL DEFAULT '[]'
+            )
+        """)
+        # Caches written before subheadings were kept
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sections)")}
+        if "subheadings" not in columns:
+            self.conn.execute("ALTER TABLE sections ADD COLUMN subheadings TEXT NOT NULL DEFAULT '[]'")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS sections_used ON sections (used)")
+        self.conn.commit()
+
+    def get_many(self, keys):
+        # {key: (content, counts, subheadings)} for the keys that are stored
+        keys = list(keys)
+        unique = list(set(keys))
+        found = {}
+        for i in range(0, len(unique), 500):
+            batch = unique[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, content, counts, subheadings FROM sections WHERE key IN ({marks})", batch)
+            for key, content, counts, subheadings in rows:
+                found[key] = (content, Counter(json.loads(counts)), json.loads(subheadings))
+        if found:
+            now = time.time()
+            self.conn.executemany("UPDATE sections SET used = ? WHERE key = ?",
+                                  [(now, key) for key in found])
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        # items: (key, content, counts, subheadings)
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO sections (key, content, counts, size, used, subheadings) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(key, content, json.dumps(counts), len(content.encode("utf-8")), now, json.dumps(subheadings))
+             for key, content, counts, subheadings in items])
+
+    def commit(self):
+        self.conn.commit()
+
+    def evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM sections").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM sections ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            doomed.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM sections WHERE key = ?", doomed)
+        self.evicted += len(doomed)
+
+    def close(self):
+        self.evict()
+        self.conn.commit()
+        self.conn.close()
@@ -1,346 +1,353 @@
+import argparse
 import json
-import os
 import random
-
-def generate_training_pairs(input_path, output_path):
-    with open(input_path, 'r', encoding='utf-8') as f:
-        cleaned_data = json.load(f)
-
-    training_pairs = []
-
-    for page in cleaned_data:
-        title = page["title"].replace("_", " ").replace("(Final Fantasy VI)", "").replace("Final Fantasy VI", "").strip()
-        title = title.replace("(summon)", "").replace("(command)", "").strip()
-
-        for section in page["sections"]:
-            content = section["content"]
-            heading = section["heading"]
-            versions = section["versions"]
-
-            # Build version context string
-            if "all_versions" in versions:
-                version_note = ""
-            else:
-                version_map = {
-                    "snes": "SNES",
-                    "ps1": "PlayStation",
-                    "gba": "GBA",
-                    "ios": "iOS/Android",
-                    "steam": "Steam",
-                    "pixel_remaster": "Pixel Remaster"
-                }
-                version_names = [version_map.get(v, v) for v in versions]
-                version_note = f" (applies to: {', '.join(version_names)})"
-
-            # Skip very short content
-            if len(content) < 30:
+from functools import partial
+
+from chunking import chunk_text, load_token_counter
+from record_io import iter_records, write_records
+from versions import format_version_note
+
+# Pairs held in memory by the shuffle buffer. Datasets up to this size are
+# fully shuffled; larger ones are shuffled within a sliding window.
+SHUFFLE_BUFFER = 10000
+SEED = 42
+
+# Longer sections are split into several answers
+MAX_ANSWER_TOKENS = 512
+
+
+# Question templates by section heading. Placeholders: {title} is the page
+# title, {heading} the section heading as written and {h} the lowercased
+# heading. Every template in a set becomes one pair sharing the section's
+# answer.
+QUESTION_TEMPLATES = {
+    # INTRODUCTION
+    "introduction": [
+        "Who is {title}?",
+        "Tell me about {title} in Final Fantasy VI.",
+        "Give me an overview of {title} in Final Fantasy VI.",
+    ],
+    # GAMEPLAY
+    "gameplay": [
+        "How does {title} work in Final Fantasy VI?",
+        "What are {title}'s gameplay mechanics in Final Fantasy VI?",
+        "Is {title} useful in Final Fantasy VI?",
+    ],
+    # MECHANICS
+    "mechanics": [
+        "How does the {title} mechanic work in Final Fantasy VI?",
+        "Explain the {title} system in Final Fantasy VI.",
+        "What are the rules for {title} in Final Fantasy VI?",
+    ],
+    # STORY / HISTORY / SYNOPSIS
+    ("story", "history", "synopsis"): [
+        "What is the story of {title} in Final Fantasy VI?",
+        "What happens to {title} in Final Fantasy VI?",
+        "What is the background of {title} in Final Fantasy VI?",
+    ],
+    # CHARACTERISTICS
+    "characteristics": [
+        "What are the characteristics and personality of {title} in Final Fantasy VI?",
+        "Describe {title}'s appearance and personality in Final Fantasy VI.",
+        "What does {title} look like in Final Fantasy VI?",
+    ],
+    # PROFILE
+    "profile": [
+        "What is the profile of {title} in Final Fantasy VI?",
+        "Describe {title} in Final Fantasy VI.",
+    ],
+    # LAYOUT
+    "layout": [
+        "What does {title} look like in Final Fantasy VI?",
+        "Describe the layout of {title} in Final Fantasy VI.",
+    ],
+    # LOCATIONS
+    ("locations", "territories"): [
+        "What locations are in {title} in Final Fantasy VI?",
+        "Where is {title} located in Final Fantasy VI?",
+    ],
+    # OBTAINED
+    "obtained": [
+        "How do I get {title} in Final Fantasy VI?",
+        "Where can I find {title} in Final Fantasy VI?",
+        "How do I obtain {title} in Final Fantasy VI?",
+    ],
+    # MAPS
+    "maps": [
+        "What does the map of {title} look like in Final Fantasy VI?",
+    ],
+    # USE
+    "use": [
+        "How do I use {title} in Final Fantasy VI?",
+        "What is {title} used for in Final Fantasy VI?",
+    ],
+    # RELEASES / DEVELOPMENT / LOCALIZATION
+    ("releases", "development", "localization"): [
+        "What are the different versions of {title} in Final Fantasy VI?",
+        "How did {title} change between versions of Final Fantasy VI?",
+    ],
+    # BEHIND THE SCENES
+    "behind the scenes": [
+        "What are some behind the scenes facts about {title} in Final Fantasy VI?",
+    ],
+    # MUSICAL THEMES
+    "musical themes": [
+        "What music plays in {title} in Final Fantasy VI?",
+        "What is the musical theme for {title} in Final Fantasy VI?",
+    ],
+    # ETYMOLOGY
+    ("etymology", "etymology and symbolism"): [
+        "What is the origin of the name {title} in Final Fantasy VI?",
+    ],
+    # OTHER APPEARANCES
+    "other appearances": [
+        "Does {title} appear in other Final Fantasy games?",
+    ],
+    # OTHER MEDIA / MERCHANDISE
+    ("other media", "merchandise"): [
+        "Has {title} from Final Fantasy VI appeared in other media or merchandise?",
+    ],
+}
+
+# Headings starting with one of these, checked after exact headings
+PREFIX_TEMPLATES = {
+    # LIST sections
+    "list of": [
+        "What are the {h} in Final Fantasy VI?",
+        "Can you list all {h} in Final Fantasy VI?",
+    ],
+}
+
+DEFAULT_TEMPLATES = [
+    "Tell me about the {heading} of {title} in Final Fantasy VI.",
+]
+
+# Asked about each === subsection of a section too long for one answer.
+# {sub} is the subsection heading.
+SUBSECTION_TEMPLATES = [
+    "Tell me about {sub} for {title} in Final Fantasy VI.",
+]
+
+# Asked about each later part of a section or subsection too long for one
+# answer. {sub} is the subsection (or section) heading and {lead} the first
+# words of the part, so every part gets a question of its own.
+CONTINUATION_TEMPLATES = [
+    "What does the {sub} section for {title} in Final Fantasy VI say about {lead}?",
+]
+LEAD_WORDS = 6
+
+
+class TemplateRegistry:
+    # Resolves a lowercased heading to its template tuple with one dict
+    # lookup, then one lookup per distinct prefix length, then the default.
+    def __init__(self, headings, prefixes, default, subsection=(), continuation=()):
+        self.headings = {}
+        for keys, templates in headings.items():
+            for key in ([keys] if isinstance(keys, str) else keys):
+                self.headings[key.lower()] = tuple(templates)
+        self.prefixes = {prefix.lower(): tuple(templates) for prefix, templates in prefixes.items()}
+        self.prefix_lengths = sorted({len(p) for p in self.prefixes}, reverse=True)
+        self.default = tuple(default)
+        self.subsection = tuple(subsection)
+        self.continuation = tuple(continuation)
+
+    def add(self, headings=None, prefixes=None, default=None, subsection=None, continuation=None):
+        # Templates from a config file are appended to any existing set
+        for heading, templates in (headings or {}).items():
+            key = heading.lower()
+            self.headings[key] = self.headings.get(key, ()) + tuple(templates)
+        for prefix, templates in (prefixes or {}).items():
+            key = prefix.lower()
+            self.prefixes[key] = self.prefixes.get(key, ()) + tuple(templates)
+        self.prefix_lengths = sorted({len(p) for p in self.prefixes}, reverse=True)
+        if default:
+            self.default += tuple(default)
+        if subsection:
+            self.subsection += tuple(subsection)
+        if continuation:
+            self.continuation += tuple(continuation)
+
+    def lookup(self, h):
+        templates = self.headings.get(h)
+        if templates is not None:
+            return templates
+        for length in self.prefix_lengths:
+            templates = self.prefixes.get(h[:length])
+            if templates is not None:
+                return templates
+        return self.default
+
+
+def load_templates(path=None):
+    # Optional JSON config: {"headings": {"boss": [...]}, "prefixes":
+    # {"list of": [...]}, "default": [...], "subsections": [...],
+    # "continuations": [...]}. Templates are checked against the placeholders
+    # their kind is formatted with up front rather than failing mid-run.
+    registry = TemplateRegistry(QUESTION_TEMPLATES, PREFIX_TEMPLATES, DEFAULT_TEMPLATES, SUBSECTION_TEMPLATES,
+                                CONTINUATION_TEMPLATES)
+    if path:
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        placeholders = {"title": "", "heading": "", "h": ""}
+        checks = [
+            ([*config.get("headings", {}).values(), *config.get("prefixes", {}).values(),
+              config.get("default", [])], placeholders),
+            ([config.get("subsections", [])], {**placeholders, "sub": ""}),
+            ([config.get("continuations", [])], {**placeholders, "sub": "", "lead": ""}),
+        ]
+        for template_sets, fields in checks:
+            for template in (t for templates in template_sets for t in templates):
+                try:
+                    template.format(**fields)
+                except (KeyError, IndexError, ValueError) as e:
+                    raise ValueError(f"Bad question template {template!r} in {path}: {e}") from None
+        registry.add(config.get("headings"), config.get("prefixes"), config.get("default"),
+                     config.get("subsections"), config.get("continuations"))
+        print(f"Loaded question templates from {path}")
+    return registry
+
+
+def clean_title(title):
+    title = title.replace("_", " ").replace("(Final Fantasy VI)", "").replace("Final Fantasy VI", "").strip()
+    return title.replace("(summon)", "").replace("(command)", "").strip()
+
+
+def section_units(section):
+    # (subsection heading or None, text) for the text before the first ===
+    # subheading and for each subsection, from the offsets data_cleaner
+    # records in "subheadings"
+    content = section["content"]
+    subheadings = section.get("subheadings") or []
+    starts = [sub["start"] for sub in subheadings] + [len(content)]
+    units = [(None, content[:starts[0]].strip())]
+    units += [(sub["heading"], content[sub["start"]:end].strip()) for sub, end in zip(subheadings, starts[1:])]
+    return units
+
+
+def lead(chunk):
+    # First words of a part, for its continuation question
+    words = chunk.lstrip("-*| ").split()[:LEAD_WORDS]
+    return " ".join(words).rstrip(".,;:!?")
+
+
+def section_pairs(title, section, registry, chunker=None, stats=None):
+    content = section["content"]
+    heading = section["heading"]
+
+    # Skip very short content
+    if len(content) < 30:
+        return []
+
+    h = heading.lower()
+    questions = [template.format(title=title, heading=heading, h=h) for template in registry.lookup(h)]
+    version_note = format_version_note(section["versions"])
+
+    chunks = chunker(content) if chunker else [content]
+    if len(chunks) == 1:
+        answers = [(questions, content)]
+    else:
+        # Over the token budget: the opening text and each === subsection are
+        # chunked apart. The section's questions go with the first part, each
+        # subsection's first part is asked about by its heading, and every
+        # later part by its first words, so no question is repeated over
+        # several partial answers.
+        answers = []
+        asked = set()
+        for sub, text in section_units(section):
+            if len(text) < 30:
                 continue
-
-            h = heading.lower()
-
-            # INTRODUCTION
-            if h == "introduction":
-                pairs = [
-                    {
-                        "instruction": f"Who is {title}?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Tell me about {title} in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Give me an overview of {title} in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # GAMEPLAY
-            elif h == "gameplay":
-                pairs = [
-                    {
-                        "instruction": f"How does {title} work in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What are {title}'s gameplay mechanics in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Is {title} useful in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # MECHANICS
-            elif h == "mechanics":
-                pairs = [
-                    {
-                        "instruction": f"How does the {title} mechanic work in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Explain the {title} system in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What are the rules for {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # STORY / HISTORY / SYNOPSIS
-            elif h in ["story", "history", "synopsis"]:
-                pairs = [
-                    {
-                        "instruction": f"What is the story of {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What happens to {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What is the background of {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # CHARACTERISTICS
-            elif h == "characteristics":
-                pairs = [
-                    {
-                        "instruction": f"What are the characteristics and personality of {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Describe {title}'s appearance and personality in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What does {title} look like in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # PROFILE
-            elif h == "profile":
-                pairs = [
-                    {
-                        "instruction": f"What is the profile of {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Describe {title} in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # LAYOUT
-            elif h == "layout":
-                pairs = [
-                    {
-                        "instruction": f"What does {title} look like in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Describe the layout of {title} in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # LOCATIONS
-            elif h in ["locations", "territories"]:
-                pairs = [
-                    {
-                        "instruction": f"What locations are in {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Where is {title} located in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # OBTAINED
-            elif h == "obtained":
-                pairs = [
-                    {
-                        "instruction": f"How do I get {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Where can I find {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"How do I obtain {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # MAPS
-            elif h == "maps":
-                pairs = [
-                    {
-                        "instruction": f"What does the map of {title} look like in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # USE
-            elif h == "use":
-                pairs = [
-                    {
-                        "instruction": f"How do I use {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What is {title} used for in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # LIST sections
-            elif h.startswith("list of"):
-                pairs = [
-                    {
-                        "instruction": f"What are the {h} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"Can you list all {h} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # RELEASES / DEVELOPMENT / LOCALIZATION
-            elif h in ["releases", "development", "localization"]:
-                pairs = [
-                    {
-                        "instruction": f"What are the different versions of {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"How did {title} change between versions of Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # BEHIND THE SCENES
-            elif h == "behind the scenes":
-                pairs = [
-                    {
-                        "instruction": f"What are some behind the scenes facts about {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # MUSICAL THEMES
-            elif h == "musical themes":
-                pairs = [
-                    {
-                        "instruction": f"What music plays in {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                    {
-                        "instruction": f"What is the musical theme for {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # ETYMOLOGY
-            elif h in ["etymology", "etymology and symbolism"]:
-                pairs = [
-                    {
-                        "instruction": f"What is the origin of the name {title} in Final Fantasy VI?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # OTHER APPEARANCES
-            elif h == "other appearances":
-                pairs = [
-                    {
-                        "instruction": f"Does {title} appear in other Final Fantasy games?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # OTHER MEDIA / MERCHANDISE
-            elif h in ["other media", "merchandise"]:
-                pairs = [
-                    {
-                        "instruction": f"Has {title} from Final Fantasy VI appeared in other media or merchandise?",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            # DEFAULT
-            else:
-                pairs = [
-                    {
-                        "instruction": f"Tell me about the {heading} of {title} in Final Fantasy VI.",
-                        "input": "",
-                        "output": content + version_note
-                    },
-                ]
-
-            training_pairs.extend(pairs)
-
-    # Shuffle for better training
-    random.shuffle(training_pairs)
-
-    # Save as JSONL
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for pair in training_pairs:
-            f.write(json.dumps(pair, ensure_ascii=False) + '\n')
-
-    print(f"Generated {len(training_pairs)} training pairs.")
+            name = sub or heading
+            for i, chunk in enumerate(chunker(text)):
+                if i:
+                    templates = [t.format(title=title, heading=heading, h=h, sub=name, lead=lead(chunk))
+                                 for t in registry.continuation]
+                elif sub:
+                    templates = [t.format(title=title, heading=heading, h=h, sub=sub) for t in registry.subsection]
+                else:
+                    templates = []
+                if not answers:
+                    templates = questions + templates
+                chunk_questions = [q for q in dict.fromkeys(templates) if q not in asked]
+                asked.update(chunk_questions)
+                if chunk_questions:
+                    answers.append((chunk_questions, chunk))
+                if stats is not None:
+                    stats["parts"] += 1
+                    stats["unasked"] += not chunk_questions
+        if stats is not None:
+            stats["long"] += 1
+
+    pairs = []
+    for answer_questions, chunk in answers:
+        # The answer is built once and shared by every pair for the chunk
+        answer = chunk + version_note
+        for question in answer_questions:
+            pairs.append({
+                "instruction": question,
+                "input": "",
+                "output": answer
+            })
+    return pairs
+
+
+def iter_pairs(pages, registry, chunker=None, stats=None):
+    # Cleaned pages -> sections -> pairs, one at a time
+    for page in pages:
+        title = clean_title(page["title"])
+        for section in page["sections"]:
+            yield from section_pairs(title, section, registry, chunker, stats)
+
+
+def shuffle_buffer(items, size=SHUFFLE_BUFFER, seed=SEED):
+    # Seeded windowed shuffle: keeps at most `size` items and emits a random
+    # one for each new arrival, then the shuffled remainder. Same input and
+    # seed give the same order.
+    rng = random.Random(seed)
+    buffer = []
+    for item in items:
+        if len(buffer) < size:
+            buffer.append(item)
+            continue
+        i = rng.randrange(size)
+        yield buffer[i]
+        buffer[i] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+def generate_training_pairs(input_path, output_path, seed=SEED, buffer_size=SHUFFLE_BUFFER,
+                            templates_path=None, max_tokens=MAX_ANSWER_TOKENS, overlap=0, tokenizer=None):
+    # Cleaned pages are read one at a time (.jsonl or a .json array) and
+    # pairs are written as they leave the shuffle buffer
+    registry = load_templates(templates_path)
+    count_tokens = load_token_counter(tokenizer)
+    chunker = partial(chunk_text, max_tokens=max_tokens, overlap=overlap, count_tokens=count_tokens)
+    pages = iter_records(input_path)
+    stats = {"long": 0, "parts": 0, "unasked": 0}
+    pairs = shuffle_buffer(iter_pairs(pages, registry, chunker, stats), buffer_size, seed)
+    count = write_records(output_path, pairs)
+
+    print(f"Generated {count} training pairs.")
+    if stats["long"]:
+        print(f"{stats['long']} sections were over {max_tokens} tokens and were split into {stats['parts']} parts")
+        if stats["unasked"]:
+            print(f"  -> {stats['unasked']} parts left out: their only question repeated one already asked")
     print(f"Saved to {output_path}")
-    return training_pairs
+    return count
 
 
 if __name__ == "__main__":
-    generate_training_pairs(
-        "data/cleaned/ff6_wiki_cleaned.json",
-        "data/training/ff6_training_pairs.jsonl"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Turn cleaned FF6 wiki pages into Q&A pairs")
+    parser.add_argument("--input", default="data/cleaned/ff6_wiki_cleaned.jsonl")
+    parser.add_argument("--output", default="data/training/ff6_training_pairs.jsonl")
+    parser.add_argument("--seed", type=int, default=SEED, help="shuffle seed")
+    parser.add_argument("--shuffle-buffer", type=int, default=SHUFFLE_BUFFER,
+                        help="pairs held in memory while shuffling")
+    parser.add_argument("--templates", help="JSON file of extra question templates")
+    parser.add_argument("--max-tokens", type=int, default=MAX_ANSWER_TOKENS,
+                        help="split answers longer than this into sentence-aligned parts")
+    parser.add_argument("--overlap", type=int, default=0, help="tokens repeated between parts")
+    parser.add_argument("--tokenizer", help='"tiktoken:<encoding>" or a local Hugging Face tokenizer')
+    args = parser.parse_args()
+    generate_training_pairs(args.input, args.output, args.seed, args.shuffle_buffer, args.templates,
+                            args.max_tokens, args.overlap, args.tokenizer)
@@ -0,0 +1,120 @@
+from bisect import bisect_right
+
+VERSION_KEYWORDS = {
+    "snes": ["snes", "super nintendo", "ff3", "woolsey", "original version"],
+    "ps1": ["ps1", "playstation", "psx"],
+    "gba": ["gba", "game boy advance", "advance version"],
+    "ios": ["ios", "android", "mobile version"],
+    "steam": ["steam", "pc version", "old steam"],
+    "pixel_remaster": ["pixel remaster", "pr version", "2022"]
+}
+
+VERSION_LABELS = {
+    "snes": "SNES",
+    "ps1": "PlayStation",
+    "gba": "GBA",
+    "ios": "iOS/Android",
+    "steam": "Steam",
+    "pixel_remaster": "Pixel Remaster"
+}
+
+ALL_VERSIONS = "all_versions"
+
+# Bit i of a version mask is the i-th key of VERSION_KEYWORDS; 0 means no tag
+VERSION_BITS = {version: 1 << i for i, version in enumerate(VERSION_KEYWORDS)}
+FULL_MASK = (1 << len(VERSION_BITS)) - 1
+
+KEYWORD_BITS = {
+    keyword: VERSION_BITS[version]
+    for version, keywords in VERSION_KEYWORDS.items()
+    for keyword in keywords
+}
+
+# Keywords are matched as whole words only. Each keyword is located with
+# str.find on the lowercased text, which runs at C speed; in CPython a single
+# alternation regex over these keywords measured several times slower than
+# that on section-sized text. Hits inside a longer word are skipped.
+def is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def find_word(text, keyword, start=0, end=None):
+    end = len(text) if end is None else end
+    i = text.find(keyword, start, end)
+    while i != -1:
+        j = i + len(keyword)
+        if (i == 0 or not is_word_char(text[i - 1])) and (j == len(text) or not is_word_char(text[j])):
+            return i
+        i = text.find(keyword, i + 1, end)
+    return -1
+
+
+def detect_version_mask(text):
+    text = text.lower()
+    mask = 0
+    for keyword, bit in KEYWORD_BITS.items():
+        if not mask & bit and find_word(text, keyword) != -1:
+            mask |= bit
+            if mask == FULL_MASK:
+                break
+    return mask
+
+
+def untagged_runs(masks, bit, starts, total):
+    # (start, end) spans of consecutive texts that don't have `bit` yet
+    run_start = None
+    for n, mask in enumerate(masks):
+        if mask & bit:
+            if run_start is not None:
+                yield run_start, starts[n]
+                run_start = None
+        elif run_start is None:
+            run_start = starts[n]
+    if run_start is not None:
+        yield run_start, total
+
+
+def detect_version_masks(texts):
+    # Bulk form: every text is lowercased into one buffer and each keyword is
+    # scanned across it once, skipping texts that already carry the keyword's
+    # version. After a hit the scan jumps to the start of the next text.
+    lowered = [t.lower() for t in texts]
+    starts = []
+    pos = 0
+    for text in lowered:
+        starts.append(pos)
+        pos += len(text) + 1
+    joined = "\0".join(lowered)
+
+    masks = [0] * len(starts)
+    for keyword, bit in KEYWORD_BITS.items():
+        for run_start, run_end in list(untagged_runs(masks, bit, starts, len(joined))):
+            i = find_word(joined, keyword, run_start, run_end)
+            while i != -1:
+                n = bisect_right(starts, i) - 1
+                masks[n] |= bit
+                if n + 1 == len(starts):
+                    break
+                i = find_word(joined, keyword, starts[n + 1], run_end)
+    return masks
+
+
+def mask_to_versions(mask):
+    found = [version for version, bit in VERSION_BITS.items() if mask & bit]
+    return found if found else [ALL_VERSIONS]
+
+
+def versions_to_mask(versions):
+    return sum(VERSION_BITS[v] for v in set(versions) if v in VERSION_BITS)
+
+
+def detect_versions(text):
+    return mask_to_versions(detect_version_mask(text))
+
+
+def format_version_note(versions):
+    # Suffix for training answers, e.g. " (applies to: SNES, GBA)"
+    if ALL_VERSIONS in versions:
+        return ""
+    names = [VERSION_LABELS.get(v, v) for v in versions]
+    return f" (applies to: {', '.join(names)})"
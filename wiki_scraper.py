@@ -1,23 +1,34 @@
-import requests
+import argparse
 import json
-import time
 import os
+import re
+from collections import deque
+from itertools import chain, islice
+
+from record_io import JsonlAppender, iter_records
+from scrape_engine import ApiClient
+from versions import detect_version_masks, mask_to_versions
 
 BASE_URL = "https://finalfantasy.fandom.com/api.php"
 
+# MediaWiki caps titles= at 50 per query for normal clients
+BATCH_SIZE = 50
+
+# Polite defaults: requests per second across all workers, and concurrent workers
+REQUEST_RATE = 2.0
+WORKERS = 4
+
+# Raw wikitext and revision ids from the last scrape, used by --refresh
+CACHE_PATH = "data/raw/scrape_cache.json"
+CHANGES_PATH = "data/raw/changed_pages.json"
+
+RAW_PATH = "data/raw/ff6_wiki_raw.json"
+RAW_JSONL_PATH = "data/raw/ff6_wiki_raw.jsonl"
+
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
 }
 
-VERSION_KEYWORDS = {
-    "snes": ["snes", "super nintendo", "ff3", "woolsey", "original version"],
-    "ps1": ["ps1", "playstation", "psx"],
-    "gba": ["gba", "game boy advance", "advance version"],
-    "ios": ["ios", "android", "mobile version"],
-    "steam": ["steam", "pc version", "old steam"],
-    "pixel_remaster": ["pixel remaster", "pr version", "2022"]
-}
-
 FF6_PAGES = [
 
     # Main
@@ -65,7 +76,7 @@ FF6_PAGES = [
     "Ragnarok_(Final_Fantasy_VI_summon)",
     "Fenrir_(Final_Fantasy_VI)",
     "Golem_(Final_Fantasy_VI)",
-    "Quetzalli_(Final_Fantasy_VI)"
+    "Quetzalli_(Final_Fantasy_VI)",
 
     # Individual Espers
     "Ramuh_(Final_Fantasy_VI)",
@@ -123,7 +134,7 @@ FF6_PAGES = [
     "Opera_House_(Final_Fantasy_VI)",
     "Veldt",
     "Doma_Castle_(Final_Fantasy_VI)",
-    "Vector",
+
     # Battle System
     "Active_Time_Battle",
     "Final_Fantasy_VI_battle_system",
@@ -143,104 +154,481 @@ FF6_PAGES = [
     "Bestiary_(Final_Fantasy_VI)",
 ]
 
-def detect_versions(text):
-    text_lower = text.lower()
-    found_versions = []
-    for version, keywords in VERSION_KEYWORDS.items():
-        if any(kw in text_lower for kw in keywords):
-            found_versions.append(version)
-    return found_versions if found_versions else ["all_versions"]
+# Category walk for --discover. Subcategories are followed breadth-first up to
+# DISCOVERY_DEPTH levels, and at most MAX_DISCOVERED titles are kept.
+FF6_CATEGORIES = [
+    "Category:Final Fantasy VI",
+    "Category:Final Fantasy VI enemies",
+    "Category:Final Fantasy VI items",
+    "Category:Final Fantasy VI weapons",
+    "Category:Final Fantasy VI armor",
+    "Category:Final Fantasy VI abilities",
+    "Category:Final Fantasy VI espers",
+    "Category:Final Fantasy VI locations",
+]
+DISCOVERY_DEPTH = 2
+MAX_DISCOVERED = 5000
+
+# Any line starting with == is a heading; the number of leading = is its level.
+# Matching from the newline (rather than ^ with MULTILINE) keeps the scan fast.
+HEADING_RE = re.compile(r'\n(==+)[^\n]*')
+FIRST_HEADING_RE = re.compile(r'(==+)[^\n]*')
+
+def split_sections(content):
+    # Single pass over the heading lines; every body is one slice of `content`.
+    # Each == section keeps its text flattened onto one line (=== lines included,
+    # as before) plus a tree of its === ... ====== subsections. start/end are
+    # character offsets into the page wikitext, heading line included.
+    sections = []
+    stack = []
+
+    def open_section(heading, start):
+        node = {"heading": heading, "start": start, "end": len(content), "subsections": []}
+        stack[:] = [(1, node)]
+        return node
+
+    def close_section(node, body_start, end):
+        node["end"] = end
+        body = content[body_start:end].replace("\n", " ").strip()
+        if body:
+            sections.append({
+                "heading": node["heading"],
+                "content": body,
+                "versions": None,
+                "start": node["start"],
+                "end": end,
+                "subsections": node["subsections"]
+            })
+
+    current = open_section("Introduction", 0)
+    body_start = 0
+
+    first = FIRST_HEADING_RE.match(content)
+    matches = HEADING_RE.finditer(content)
+    if first:
+        matches = chain([first], matches)
+
+    for match in matches:
+        line_start = match.start(1)
+        level = min(len(match.group(1)), 6)
+        heading = content[line_start:match.end()].replace("=", "").strip()
+
+        # Anything at this level or shallower ends at this heading
+        while len(stack) > 1 and stack[-1][0] >= level:
+            stack.pop()[1]["end"] = line_start
+
+        if level == 2:
+            close_section(current, body_start, line_start)
+            current = open_section(heading, line_start)
+            body_start = match.end()
+            continue
+
+        parent = stack[-1][1]
+        path = parent.get("path", [parent["heading"]])
+        node = {
+            "heading": heading,
+            "level": level,
+            "path": path + [heading],
+            "start": line_start,
+            "end": len(content),
+            "subsections": []
+        }
+        parent["subsections"].append(node)
+        stack.append((level, node))
+
+    close_section(current, body_start, len(content))
+
+    # Version tags for every section in one scan
+    masks = detect_version_masks([s["content"] for s in sections])
+    for section, mask in zip(sections, masks):
+        section["versions"] = mask_to_versions(mask)
+    return sections
+
+
+def build_page(title, revision):
+    return {
+        "title": title,
+        "url": f"https://finalfantasy.fandom.com/wiki/{title}",
+        "pageid": revision.get("pageid"),
+        "canonical_title": revision.get("canonical_title"),
+        "revid": revision.get("revid"),
+        "timestamp": revision.get("timestamp"),
+        "sections": split_sections(revision["content"])
+    }
+
+
+def make_client(workers=WORKERS, rate=REQUEST_RATE, base_url=None):
+    return ApiClient(base_url or BASE_URL, headers=HEADERS, rate=rate, workers=workers)
 
-def scrape_page_api(title):
+
+def fetch_revisions(titles, client, with_content=True):
+    # One query for up to BATCH_SIZE titles. Returns {requested title: revision or None},
+    # where a revision is {"revid", "timestamp"} plus "content" when requested.
     params = {
         "action": "query",
-        "titles": title,
+        "titles": "|".join(titles),
         "prop": "revisions",
-        "rvprop": "content",
-        "rvslots": "main",
+        "rvprop": "ids|timestamp|content" if with_content else "ids|timestamp",
+        "redirects": "1",
         "format": "json",
         "formatversion": "2"
     }
+    if with_content:
+        params["rvslots"] = "main"
+
+    normalized = {}
+    redirects = {}
+    pages_by_title = {}
+    continue_params = {}
+
+    # Large batches can exceed the API result size limit, in which case
+    # the remaining revisions come back through "continue".
+    while True:
+        data = client.get_json({**params, **continue_params})
+
+        query = data.get("query", {})
+        for entry in query.get("normalized", []):
+            normalized[entry["from"]] = entry["to"]
+        for entry in query.get("redirects", []):
+            redirects[entry["from"]] = entry["to"]
+        for page in query.get("pages", []):
+            known = pages_by_title.get(page["title"])
+            if known is None or not known.get("revisions"):
+                pages_by_title[page["title"]] = page
+
+        if "continue" not in data:
+            break
+        continue_params = data["continue"]
+
+    results = {}
+    for title in titles:
+        resolved = normalized.get(title, title)
+        resolved = redirects.get(resolved, resolved)
+        page = pages_by_title.get(resolved)
+        if page is None or "missing" in page or "invalid" in page or not page.get("revisions"):
+            results[title] = None
+            continue
+
+        rev = page["revisions"][0]
+        revision = {
+            "pageid": page.get("pageid"),
+            "canonical_title": page["title"],
+            "revid": rev.get("revid"),
+            "timestamp": rev.get("timestamp"),
+        }
+        if with_content:
+            content = rev.get("slots", {}).get("main", {}).get("content", "")
+            if not content:
+                results[title] = None
+                continue
+            revision["content"] = content
+        results[title] = revision
+
+    return results
 
-    try:
-        response = requests.get(BASE_URL, params=params, headers=HEADERS, timeout=10)
-        response.raise_for_status()
-        data = response.json()
 
-        pages = data.get("query", {}).get("pages", [])
-        if not pages:
-            return None
+def scrape_pages_batch(titles, client):
+    # Returns {requested title: page or None}
+    try:
+        revisions = fetch_revisions(titles, client)
+    except Exception as e:
+        print(f"Error scraping batch starting at {titles[0]}: {e}")
+        return {title: None for title in titles}
 
-        page = pages[0]
-        if "missing" in page:
+    results = {}
+    for title in titles:
+        revision = revisions[title]
+        if revision is None:
             print(f"  -> Page not found: {title}")
-            return None
-
-        content = page.get("revisions", [{}])[0].get("slots", {}).get("main", {}).get("content", "")
-
-        if not content:
-            return None
-
-        # Split into sections by == headings ==
-        sections = []
-        current_heading = "Introduction"
-        current_content = ""
-
-        for line in content.split("\n"):
-            if line.startswith("==") and not line.startswith("==="):
-                if current_content.strip():
-                    sections.append({
-                        "heading": current_heading,
-                        "content": current_content.strip(),
-                        "versions": detect_versions(current_content)
-                    })
-                current_heading = line.replace("=", "").strip()
-                current_content = ""
-            else:
-                current_content += " " + line
-
-        # Last section
-        if current_content.strip():
-            sections.append({
-                "heading": current_heading,
-                "content": current_content.strip(),
-                "versions": detect_versions(current_content)
-            })
+        results[title] = build_page(title, revision) if revision else None
+    return results
 
-        return {
-            "title": title,
-            "url": f"https://finalfantasy.fandom.com/wiki/{title}",
-            "sections": sections
-        }
 
-    except Exception as e:
-        print(f"Error scraping {title}: {e}")
-        return None
+def scrape_page_api(title, client=None):
+    client = client or make_client(workers=1)
+    return scrape_pages_batch([title], client)[title]
+
+
+def batched(items, size):
+    items = iter(items)
+    while True:
+        batch = list(islice(items, size))
+        if not batch:
+            return
+        yield batch
 
 
-def scrape_all():
+def title_key(title):
+    # MediaWiki treats underscores as spaces and upper-cases the first letter
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+def iter_query(client, params):
+    # Follows "continue" one page of results at a time
+    continue_params = {}
+    while True:
+        data = client.get_json({**params, **continue_params})
+        yield data.get("query", {})
+        if "continue" not in data:
+            return
+        continue_params = data["continue"]
+
+
+def iter_category_members(client, category):
+    params = {
+        "action": "query",
+        "generator": "categorymembers",
+        "gcmtitle": category,
+        "gcmtype": "page|subcat",
+        "gcmlimit": "max",
+        "format": "json",
+        "formatversion": "2"
+    }
+    for query in iter_query(client, params):
+        for page in query.get("pages", []):
+            yield page["title"], page.get("ns", 0)
+
+
+def iter_allpages(client, prefix):
+    params = {
+        "action": "query",
+        "list": "allpages",
+        "apprefix": prefix,
+        "apnamespace": "0",
+        "apfilterredir": "nonredirects",
+        "aplimit": "max",
+        "format": "json",
+        "formatversion": "2"
+    }
+    for query in iter_query(client, params):
+        for page in query.get("allpages", []):
+            yield page["title"]
+
+
+def discover_titles(client, seeds=(), categories=FF6_CATEGORIES, prefixes=(),
+                    max_depth=DISCOVERY_DEPTH, limit=MAX_DISCOVERED):
+    # Yields unique article titles (underscored, like FF6_PAGES) as the walk finds them
+    seen = set()
+    count = 0
+
+    def accept(title):
+        nonlocal count
+        key = title_key(title)
+        if key in seen or count >= limit:
+            return False
+        seen.add(key)
+        count += 1
+        return True
+
+    for title in seeds:
+        if accept(title):
+            yield title
+
+    for prefix in prefixes:
+        for title in iter_allpages(client, prefix):
+            if count >= limit:
+                return
+            if accept(title):
+                yield title.replace(" ", "_")
+
+    visited = set()
+    frontier = deque((title_key(c), 0) for c in categories)
+    while frontier and count < limit:
+        category, depth = frontier.popleft()
+        if category in visited:
+            continue
+        visited.add(category)
+        print(f"  -> Walking {category}")
+        for title, ns in iter_category_members(client, category):
+            if ns == 14:
+                if depth < max_depth and title_key(title) not in visited:
+                    frontier.append((title_key(title), depth + 1))
+            elif ns == 0 and accept(title):
+                yield title.replace(" ", "_")
+            if count >= limit:
+                return
+
+
+def load_cache(path=CACHE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_cache(cache, path=CACHE_PATH):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def fetch_all(titles, client, with_content=True):
+    # Fetches every batch through the client's worker pool. Titles from batches
+    # that errored out are left out of the result instead of reported missing.
+    def fetch(batch):
+        try:
+            return fetch_revisions(batch, client, with_content)
+        except Exception as e:
+            print(f"Error scraping batch starting at {batch[0]}: {e}")
+            return {}
+
+    results = {}
+    for batch_results in client.map(fetch, list(batched(titles, BATCH_SIZE))):
+        results.update(batch_results)
+    return results
+
+
+def scrape_all(workers=WORKERS, rate=REQUEST_RATE, refresh=False, discover=False):
     os.makedirs("data/raw", exist_ok=True)
-    all_data = []
+    cache = load_cache()
+    missing = []
 
-    for i, page in enumerate(FF6_PAGES):
-        print(f"Scraping ({i+1}/{len(FF6_PAGES)}): {page}")
-        data = scrape_page_api(page)
-        if data:
-            all_data.append(data)
-            print(f"  -> Got {len(data['sections'])} sections for '{data['title']}'")
+    client = make_client(workers=workers, rate=rate)
+    try:
+        if discover:
+            titles = list(discover_titles(client, seeds=FF6_PAGES))
+            print(f"Discovered {len(titles)} pages")
         else:
+            titles = FF6_PAGES
+
+        if refresh and cache:
+            # Cheap metadata pass: only revids and timestamps, no page bodies
+            print(f"Checking revisions for {len(titles)} pages ({workers} workers, {rate} req/s)")
+            info = fetch_all(titles, client, with_content=False)
+            missing = [t for t in titles if t in info and info[t] is None]
+            to_fetch = [
+                t for t in titles
+                if info.get(t) and (t not in cache or cache[t]["revid"] != info[t]["revid"])
+            ]
+        else:
+            to_fetch = list(titles)
+
+        print(f"Fetching {len(to_fetch)} of {len(titles)} pages ({workers} workers, {rate} req/s)")
+        fetched = fetch_all(to_fetch, client) if to_fetch else {}
+    finally:
+        client.close()
+
+    changed = []
+    pages = {}
+    for i, title in enumerate(to_fetch):
+        print(f"Scraping ({i+1}/{len(to_fetch)}): {title}")
+        revision = fetched.get(title)
+        if revision:
+            if cache.get(title, {}).get("revid") != revision["revid"]:
+                changed.append(title)
+            cache[title] = revision
+            pages[title] = build_page(title, revision)
+            print(f"  -> Got {len(pages[title]['sections'])} sections for '{title}'")
+        else:
+            if title in fetched:
+                missing.append(title)
             print(f"  -> Failed or not found")
 
-        time.sleep(1)
+    for title in missing:
+        cache.pop(title, None)
+    save_cache(cache)
 
-    output_path = "data/raw/ff6_wiki_raw.json"
+    # Unchanged pages are rebuilt from the cached wikitext. Aliases that
+    # redirect to an article already kept are dropped.
+    all_data = []
+    seen_pages = set()
+    for title in titles:
+        if title not in cache:
+            continue
+        page_key = cache[title].get("pageid") or title
+        if page_key in seen_pages:
+            print(f"  -> Skipping {title}: same page as an earlier title ({cache[title].get('canonical_title')})")
+            continue
+        seen_pages.add(page_key)
+        all_data.append(pages.get(title) or build_page(title, cache[title]))
+
+    output_path = RAW_PATH
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(all_data, f, indent=2, ensure_ascii=False)
 
-    print(f"\nDone! Scraped {len(all_data)} pages.")
+    # Later stages can use this to reprocess only what moved
+    with open(CHANGES_PATH, "w", encoding="utf-8") as f:
+        json.dump({"changed": changed, "missing": missing}, f, indent=2, ensure_ascii=False)
+
+    print(f"\nDone! Scraped {len(all_data)} pages ({len(changed)} changed, {len(missing)} missing).")
+    for title in changed:
+        print(f"  changed: {title}")
     print(f"Saved to {output_path}")
     return all_data
 
 
+def scrape_stream(titles=None, output_path=RAW_JSONL_PATH, resume=False, workers=WORKERS, rate=REQUEST_RATE,
+                  discover=False):
+    # Appends one record per page as batches arrive, fsyncing after every batch
+    if os.path.exists(output_path) and not resume:
+        os.remove(output_path)
+
+    done_titles = set()
+    seen_pages = set()
+    if resume and os.path.exists(output_path):
+        for record in iter_records(output_path):
+            done_titles.add(record["title"])
+            if record.get("pageid") is not None:
+                seen_pages.add(record["pageid"])
+        print(f"Resuming: {len(done_titles)} pages already in {output_path}")
+
+    written = 0
+    done = 0
+    client = make_client(workers=workers, rate=rate)
+    if titles is None:
+        titles = discover_titles(client, seeds=FF6_PAGES) if discover else FF6_PAGES
+    titles = (t for t in titles if t not in done_titles)
+    print(f"Fetching pages in batches of {BATCH_SIZE} ({workers} workers, {rate} req/s)")
+
+    def fetch(batch):
+        return batch, scrape_pages_batch(batch, client)
+
+    try:
+        with JsonlAppender(output_path) as out:
+            for batch, results in client.map(fetch, batched(titles, BATCH_SIZE)):
+                for title in batch:
+                    done += 1
+                    print(f"Scraping ({done}): {title}")
+                    data = results.get(title)
+                    if data and data["pageid"] in seen_pages:
+                        print(f"  -> Skipping: same page as an earlier title ({data['canonical_title']})")
+                    elif data:
+                        seen_pages.add(data["pageid"])
+                        out.write(data)
+                        written += 1
+                        print(f"  -> Got {len(data['sections'])} sections for '{data['title']}'")
+                    else:
+                        print(f"  -> Failed or not found")
+                out.checkpoint()
+    finally:
+        client.close()
+
+    print(f"\nDone! Scraped {written} pages ({len(done_titles) + written} total).")
+    print(f"Saved to {output_path}")
+
+
 if __name__ == "__main__":
-    scrape_all()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Scrape FF6 pages from the Final Fantasy Wiki")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="concurrent requests")
+    parser.add_argument("--rate", type=float, default=REQUEST_RATE, help="max requests per second")
+    parser.add_argument("--refresh", action="store_true",
+                        help="only re-download pages whose revision changed since the cached scrape "
+                             "(not with --stream/--resume, which don't use the scrape cache)")
+    parser.add_argument("--stream", action="store_true",
+                        help=f"append pages to {RAW_JSONL_PATH} as they arrive instead of writing one JSON file")
+    parser.add_argument("--resume", action="store_true",
+                        help="with --stream, skip pages already present in the JSONL output")
+    parser.add_argument("--discover", action="store_true",
+                        help="add pages found by walking the FF6 categories to the FF6_PAGES list")
+    args = parser.parse_args()
+    # Stream mode neither reads nor writes scrape_cache.json, so it has no
+    # revisions to compare against
+    if args.refresh and (args.stream or args.resume):
+        parser.error("--refresh only works with the default single-file scrape, not --stream/--resume")
+
+    if args.stream or args.resume:
+        scrape_stream(resume=args.resume, workers=args.workers, rate=args.rate, discover=args.discover)
+    else:
+        scrape_all(workers=args.workers, rate=args.rate, refresh=args.refresh, discover=args.discover)